@@ -0,0 +1,144 @@
+import csv
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+from bisect import bisect_left
+from urllib.parse import quote, unquote
+
+from history import parse_duration
+
+# One perfMonitor sample: timestamp in seconds, CPU and memory usage percent.
+RECORD = struct.Struct('<qff')
+SUFFIX = '.perf'
+
+
+def archive_path(directory, tenant, filer):
+    """Return the archive file of a Filer. Tenant and Filer names are quoted to be safe as file names."""
+    return os.path.join(directory, quote(tenant or '', safe=''), quote(filer, safe='') + SUFFIX)
+
+
+class _Timestamps:
+    """Sequence view of the timestamps in a mapped archive, for bisect."""
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+
+    def __len__(self):
+        return len(self._buffer) // RECORD.size
+
+    def __getitem__(self, index):
+        return RECORD.unpack_from(self._buffer, index * RECORD.size)[0]
+
+
+class SampleArchive:
+    """
+    Append-only archive of raw perfMonitor samples, one file per Filer.
+
+    Each file is a run of fixed-width records, ordered by timestamp.
+    Consecutive sweeps return overlapping sample windows, so only samples
+    newer than the last archived one are appended.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.samples = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, tenant, filer, samples):
+        """
+        Append new (timestamp, cpu, memory) samples of a Filer and return how many were added.
+
+        :param str tenant: Tenant of the Filer
+        :param str filer: Filer name
+        :param list[tuple] samples: Samples from the latest perfMonitor window
+        """
+        path = archive_path(self.directory, tenant, filer)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, mode='ab+') as archive_file:
+            size = archive_file.tell()
+            if size % RECORD.size:
+                # Drop a partial record left by an interrupted write.
+                size -= size % RECORD.size
+                archive_file.truncate(size)
+            last = None
+            if size:
+                archive_file.seek(size - RECORD.size)
+                last = RECORD.unpack(archive_file.read(RECORD.size))[0]
+            new = sorted((int(timestamp), cpu, memory) for timestamp, cpu, memory in samples
+                         if last is None or int(timestamp) > last)
+            archive_file.seek(0, os.SEEK_END)
+            archive_file.write(b''.join(RECORD.pack(*sample) for sample in new))
+        self.samples += len(new)
+        logging.debug("Archived %s new samples of %s", len(new), filer)
+        return len(new)
+
+
+def read_samples(path, start=None, end=None):
+    """
+    Yield (timestamp, cpu, memory) samples from a Filer's archive file.
+    The file is memory mapped and the start of the time range is found by
+    binary search, so only the requested samples are read.
+
+    :param str path: Archive file
+    :param int,optional start: First timestamp to include
+    :param int,optional end: Last timestamp to include
+    """
+    with open(path, mode='rb') as archive_file:
+        size = os.fstat(archive_file.fileno()).st_size
+        size -= size % RECORD.size
+        if not size:
+            return
+        with mmap.mmap(archive_file.fileno(), size, access=mmap.ACCESS_READ) as buffer:
+            first = bisect_left(_Timestamps(buffer), start) if start is not None else 0
+            for offset in range(first * RECORD.size, size, RECORD.size):
+                sample = RECORD.unpack_from(buffer, offset)
+                if end is not None and sample[0] > end:
+                    break
+                yield sample
+
+
+def iter_archives(directory, tenant=None, filer=None):
+    """Yield (tenant, filer, path) for archive files in a directory."""
+    for tenant_dir in sorted(os.listdir(directory)):
+        tenant_path = os.path.join(directory, tenant_dir)
+        if not os.path.isdir(tenant_path) or (tenant is not None and unquote(tenant_dir) != tenant):
+            continue
+        for name in sorted(os.listdir(tenant_path)):
+            if name.endswith(SUFFIX) and (filer is None or unquote(name[:-len(SUFFIX)]) == filer):
+                yield unquote(tenant_dir), unquote(name[:-len(SUFFIX)]), os.path.join(tenant_path, name)
+
+
+def query_samples(directory, tenant=None, filer=None, since=None, limit=None):
+    """
+    Print archived perfMonitor samples as CSV.
+
+    :param str directory: Sample archive directory
+    :param str,optional tenant: Only include this Tenant
+    :param str,optional filer: Only include this Filer
+    :param str,optional since: Only include samples within this duration, e.g. '7d'
+    :param int,optional limit: Maximum number of rows
+    """
+    logging.info('Starting query_samples task.')
+    if not os.path.isdir(directory):
+        logging.error("Sample archive not found: %s", directory)
+        sys.exit("Make sure you entered a valid directory name and it exists")
+    try:
+        start = int(time.time()) - parse_duration(since) if since else None
+    except ValueError as error:
+        logging.error(error)
+        sys.exit("Invalid query_samples arguments.")
+    writer = csv.writer(sys.stdout)
+    writer.writerow(['tenant', 'filer', 'timestamp', 'cpu', 'memory'])
+    count = 0
+    for tenant_name, filer_name, path in iter_archives(directory, tenant, filer):
+        for timestamp, cpu, memory in read_samples(path, start):
+            if limit and count >= limit:
+                break
+            writer.writerow([tenant_name, filer_name, timestamp, round(cpu, 2), round(memory, 2)])
+            count += 1
+        if limit and count >= limit:
+            break
+    logging.info("Finished query_samples task. %s rows.", count)
@@ -0,0 +1,244 @@
+"""
+Local stand-in for a CTERA Portal global admin session, for benchmarks.
+
+Serves synthetic Tenants and connected Filers in process, answering the
+calls ctools makes: portals.tenants/browse, users.session, devices.filers,
+devices.device, and on each Filer get_multi, get, cli.run_command,
+licenses.get, sync, ssh and users. Every call can add latency with jitter
+and fail at a given rate, and is counted per call type. With a capacity,
+calls slow down in proportion once more than that many are in flight, like
+an overloaded Portal.
+
+    portal = MockPortal(tenants=10, filers=1000, latency=0.05, jitter=0.02, failure_rate=0.01)
+    portal = MockPortal(tenants=10, filers=100, latency=0.05, capacity=16)
+"""
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from types import SimpleNamespace
+
+
+# Firmware versions, assigned to Filers in turn
+FIRMWARE = ['7.5.182.16', '7.6.1120.14']
+
+
+class MockError(ConnectionError):
+    """A simulated connection failure, which ctools treats as transient."""
+
+
+class MockPortal:
+    """
+    In-process Portal with tenants Tenants of filers Filers each.
+
+    :param int tenants: Number of Tenants
+    :param int filers: Number of connected Filers per Tenant
+    :param float latency: Mean seconds added to each call
+    :param float jitter: Maximum seconds added to or taken from latency
+    :param float failure_rate: Probability that a Filer call raises MockError
+    :param int seed: Random seed, for repeatable runs
+    :param int samples: perfMonitor samples returned per Filer
+    :param int capacity: Calls in flight served at full speed. Default no limit
+    :param float sync_delay: Seconds a Filer's sync takes to stop after it is suspended
+    """
+
+    def __init__(self, tenants=1, filers=100, latency=0.0, jitter=0.0, failure_rate=0.0, seed=0, samples=60,
+                 capacity=None, sync_delay=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.samples = samples
+        self.capacity = capacity
+        self.sync_delay = sync_delay
+        self.in_flight = 0
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._tenant = 'Admin'
+        self.tenant_names = [f'tenant-{t:04d}' for t in range(tenants)]
+        self.filers = {name: [MockFiler(self, name, f'vgw-{t:04d}-{f:05d}', FIRMWARE[f % len(FIRMWARE)])
+                              for f in range(filers)]
+                       for t, name in enumerate(self.tenant_names)}
+        self._by_name = {(filer.tenant, filer.name): filer for filers in self.filers.values() for filer in filers}
+        self.portals = SimpleNamespace(browse_global_admin=self._browse_global_admin, browse=self._browse,
+                                       tenants=self._tenants)
+        self.users = SimpleNamespace(session=self._session)
+        self.devices = SimpleNamespace(filers=self._filers, device=self._device)
+
+    def call(self, name, can_fail=False):
+        """Count a call, wait for its simulated latency and maybe fail it."""
+        with self._lock:
+            self.calls[name] += 1
+            self.in_flight += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            if self.capacity and self.in_flight > self.capacity:
+                delay *= self.in_flight / self.capacity
+            failed = can_fail and self._random.random() < self.failure_rate
+        if delay:
+            time.sleep(delay)
+        with self._lock:
+            self.in_flight -= 1
+        if failed:
+            raise MockError(f'Simulated failure of {name}')
+
+    def total_calls(self):
+        """Return the number of calls made so far."""
+        with self._lock:
+            return sum(self.calls.values())
+
+    def logout(self):
+        self.call('logout')
+
+    def _browse_global_admin(self):
+        self.call('portals.browse_global_admin')
+        self._tenant = 'Admin'
+
+    def _browse(self, tenant):
+        self.call('portals.browse')
+        self._tenant = tenant
+
+    def _tenants(self):
+        self.call('portals.tenants')
+        return [SimpleNamespace(name=name) for name in self.tenant_names]
+
+    def _session(self):
+        self.call('users.session')
+        return SimpleNamespace(user=SimpleNamespace(tenant=self._tenant))
+
+    def _filers(self, include=None):  # pylint: disable=unused-argument
+        self.call('devices.filers')
+        # Like the SDK, return new device objects for each listing.
+        if self._tenant == 'Admin':
+            return [filer.copy() for filers in self.filers.values() for filer in filers]
+        return [filer.copy() for filer in self.filers.get(self._tenant, [])]
+
+    def _device(self, name, tenant=None, include=None):
+        self.call('devices.device', can_fail=True)
+        try:
+            filer = self._by_name[(tenant or self._tenant, name)]
+        except KeyError as error:
+            raise LookupError(f'Device not found: {name}') from error
+        # Like the SDK, only return the fields asked for.
+        include = include or []
+        filer = filer.copy()
+        if 'version' not in include:
+            del filer.version
+        if 'deviceConnectionStatus.connected' not in include:
+            del filer.deviceConnectionStatus
+        if 'deviceReportedStatus.config.hostname' not in include:
+            del filer.deviceReportedStatus
+        return filer
+
+
+class MockFiler:
+    """A synthetic connected Filer with randomized status."""
+
+    def __init__(self, portal, tenant, name, version=FIRMWARE[0]):
+        self._portal = portal
+        self.tenant = tenant
+        self.name = name
+        self.version = version
+        self.deviceConnectionStatus = SimpleNamespace(connected=True)  # pylint: disable=invalid-name
+        self.deviceReportedStatus = SimpleNamespace(  # pylint: disable=invalid-name
+            config=SimpleNamespace(hostname=name.lower()))
+        self._sync_off_at = None
+
+    # Services are built on access. Storing bound methods would make each Filer a reference
+    # cycle, which lingers until garbage collection and inflates peak memory in benchmarks.
+    @property
+    def cli(self):
+        return SimpleNamespace(run_command=self._run_command)
+
+    @property
+    def licenses(self):
+        return SimpleNamespace(get=self._license)
+
+    @property
+    def sync(self):
+        return SimpleNamespace(suspend=self._suspend, unsuspend=self._unsuspend, get_status=self._sync_status)
+
+    @property
+    def ssh(self):
+        return SimpleNamespace(enable=self._ssh_enable, disable=self._ssh_disable)
+
+    @property
+    def users(self):
+        return SimpleNamespace(modify=self._modify_user)
+
+    def copy(self):
+        """Return a new device object for this Filer, as a fresh listing would."""
+        return MockFiler(self._portal, self.tenant, self.name, self.version)
+
+    def session(self):
+        # Like the SDK, a device shares the Portal session, which follows the browsed Tenant.
+        return SimpleNamespace(user=SimpleNamespace(tenant=self._portal._tenant))
+
+    def get(self, path):
+        self._portal.call('filer.get', can_fail=True)
+        return f'{self.name}:{path}'
+
+    def get_multi(self, path, paths):  # pylint: disable=unused-argument
+        self._portal.call('filer.get_multi', can_fail=True)
+        now = int(time.time())
+        rand = random.Random(zlib.crc32(self.name.encode()) ^ now // 60)
+        info = SimpleNamespace()
+        info.status = SimpleNamespace(
+            device=SimpleNamespace(runningFirmware=self.version),
+            network=SimpleNamespace(ports=[SimpleNamespace(ip=SimpleNamespace(
+                address='10.0.0.1', DNSServer1='10.0.0.2', DNSServer2='10.0.0.3'))]),
+            fileservices=SimpleNamespace(cifs=SimpleNamespace(joinStatus=0)))
+        info.proc = SimpleNamespace(
+            cloudsync=SimpleNamespace(serviceStatus=SimpleNamespace(
+                id='Synced', uploadingFiles=rand.randint(0, 20000), scanningFiles=rand.randint(0, 100),
+                selfVerificationScanningFiles=0)),
+            time=SimpleNamespace(uptime='12 days, 3:04:05'),
+            storage=SimpleNamespace(summary=SimpleNamespace(
+                totalVolumeSpace=1024000, usedVolumeSpace=512000, freeVolumeSpace=512000)),
+            perfMonitor=SimpleNamespace(
+                current=SimpleNamespace(cpu=rand.randint(0, 100), memUsage=rand.randint(0, 100)),
+                samples=[SimpleNamespace(timestamp=now - 60 * i, cpu=rand.randint(0, 100),
+                                         memUsage=rand.randint(0, 100))
+                         for i in range(self._portal.samples, 0, -1)]))
+        if 'config' in paths:
+            info.config = SimpleNamespace(
+                cloudsync=SimpleNamespace(selfScanVerificationIntervalInHours=168, cloudExtender=SimpleNamespace(
+                    storageThresholdPercentTrigger=80)),
+                logging=SimpleNamespace(metalog=SimpleNamespace(maxFileSizeMB=100, maxfiles=10),
+                                        alert=SimpleNamespace(minSeverity='Warning')),
+                time=SimpleNamespace(NTPMode='auto', TimeZone='UTC', NTPServer=['pool.ntp.org']))
+        return info
+
+    def _run_command(self, command):
+        self._portal.call('filer.cli.run_command', can_fail=True)
+        if command == 'dbg level':
+            return 'Current debug level: info\nmetalogs: level=info  (0x00)\n'
+        return f'{self.name}: {command}: OK'
+
+    def _license(self):
+        self._portal.call('filer.licenses.get', can_fail=True)
+        return 'EV16'
+
+    def _suspend(self, wait=True):
+        self._portal.call('filer.sync.suspend', can_fail=True)
+        self._sync_off_at = time.monotonic() + self._portal.sync_delay
+        if wait:
+            time.sleep(self._portal.sync_delay)
+
+    def _unsuspend(self):
+        self._portal.call('filer.sync.unsuspend', can_fail=True)
+        self._sync_off_at = None
+
+    def _sync_status(self):
+        self._portal.call('filer.sync.get_status', can_fail=True)
+        suspended = self._sync_off_at is not None and time.monotonic() >= self._sync_off_at
+        return SimpleNamespace(id='Off' if suspended else 'Synced')
+
+    def _ssh_enable(self, public_key=None):  # pylint: disable=unused-argument
+        self._portal.call('filer.ssh.enable', can_fail=True)
+
+    def _ssh_disable(self):
+        self._portal.call('filer.ssh.disable', can_fail=True)
+
+    def _modify_user(self, username, password):  # pylint: disable=unused-argument
+        self._portal.call('filer.users.modify', can_fail=True)
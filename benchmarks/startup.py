@@ -0,0 +1,69 @@
+"""
+Startup-time benchmark for the ctools CLI entry path.
+
+Times `ctools.py --ignore-gooey <task> -h` in fresh interpreters and fails if
+the median is over a budget, or if the CLI path imported the GUI stack,
+cterasdk or task modules it doesn't need.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 20 --budget 0.3 --task run_cmd
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+CTOOLS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ctools.py')
+# Top level modules the CLI must not import just to parse arguments.
+FORBIDDEN = ['gooey', 'wx', 'cterasdk', 'login', 'filer', 'inventory', 'status', 'run_cmd',
+             'unlock', 'suspend_sync', 'unsuspend_sync', 'reset_password', 'watch', 'bulk', 'archive', 'history',
+             'timing', 'breaker', 'checkpoint', 'merge']
+
+
+def time_startup(task, runs):
+    """Return wall times in seconds for runs of the CLI help for task."""
+    command = [sys.executable, CTOOLS, '--ignore-gooey', task, '-h']
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def imported_modules(task):
+    """Return top level module names imported by the CLI help for task."""
+    command = [sys.executable, '-X', 'importtime', CTOOLS, '--ignore-gooey', task, '-h']
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    modules = set()
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            modules.add(line.rsplit('|', 1)[1].strip().split('.')[0])
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ctools CLI startup time')
+    parser.add_argument('--runs', type=int, default=10, help='Number of timed runs')
+    parser.add_argument('--budget', type=float, default=0.5, help='Maximum median seconds')
+    parser.add_argument('--task', default='get_status', help='Task to show help for')
+    args = parser.parse_args()
+
+    times = time_startup(args.task, args.runs)
+    median = statistics.median(times)
+    print(f"{args.task} -h: median {median:.3f}s min {min(times):.3f}s max {max(times):.3f}s over {args.runs} runs")
+    failed = False
+    if median > args.budget:
+        print(f"FAIL: median startup {median:.3f}s is over budget {args.budget:.3f}s")
+        failed = True
+    unexpected = sorted(imported_modules(args.task).intersection(FORBIDDEN))
+    if unexpected:
+        print(f"FAIL: CLI startup imported {', '.join(unexpected)}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
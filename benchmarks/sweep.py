@@ -0,0 +1,119 @@
+"""
+Throughput benchmark for fleet tasks against a local mock Portal.
+
+Runs get_filers, write_status or multi_filer_run over synthetic Tenants and
+Filers (see mock_portal.py) and reports wall time, rows per second, peak
+traced memory and API calls per Filer. No live Portal is needed.
+
+    python benchmarks/sweep.py
+    python benchmarks/sweep.py --scenario status --tenants 20 --filers 1000 --latency 0.05 --jitter 0.02
+    python benchmarks/sweep.py --scenario run_cmd --failure-rate 0.05 --workers 32 --min-rate 200
+    python benchmarks/sweep.py --scenario run_cmd --latency 0.05 --capacity 16 --workers 64 --adaptive
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_portal import MockPortal  # noqa: E402  pylint: disable=wrong-import-position
+from fleet import AdaptiveLimit, DEFAULT_WORKERS, DEFAULT_TIMEOUT  # noqa: E402  pylint: disable=wrong-import-position
+import timing  # noqa: E402  pylint: disable=wrong-import-position
+
+SCENARIOS = ['filers', 'status', 'run_cmd']
+
+
+def run_scenario(portal, scenario, workers, timeout, columns, fmt):
+    """Run one scenario against portal and return the number of rows produced."""
+    # Imported here so that the benchmark measures memory used by the task, not the imports.
+    from filer import get_filers  # pylint: disable=import-outside-toplevel
+    from run_cmd import multi_filer_run  # pylint: disable=import-outside-toplevel
+    from status import open_status_output, write_status  # pylint: disable=import-outside-toplevel
+    from columns import select_columns  # pylint: disable=import-outside-toplevel
+
+    if scenario == 'filers':
+        return len(get_filers(portal, all_tenants=True))
+    if scenario == 'run_cmd':
+        return len(multi_filer_run(portal, 'show /status/device/runningFirmware', True, workers, timeout))
+    columns = select_columns(columns)
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, f'status.{fmt}')
+        with open_status_output(filename, fmt, columns=columns) as writer:
+            write_status(portal, writer, True, workers, timeout, columns=columns)
+            return writer.rows
+
+
+def benchmark(args):
+    """Run the selected scenario and return a dict of results."""
+    portal = MockPortal(args.tenants, args.filers, args.latency, args.jitter, args.failure_rate, args.seed,
+                        capacity=args.capacity)
+    workers = AdaptiveLimit(args.min_workers, args.workers) if args.adaptive else args.workers
+    filers = args.tenants * args.filers
+    # Import task modules before tracing, so their import isn't counted.
+    run_scenario(MockPortal(1, 1), args.scenario, 1, args.timeout, args.columns, args.format)
+    if args.memory:
+        tracemalloc.start()
+    if args.trace:
+        timing.start_tracing()
+    start = time.perf_counter()
+    rows = run_scenario(portal, args.scenario, workers, args.timeout, args.columns, args.format)
+    wall = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if args.memory else None
+    if args.memory:
+        tracemalloc.stop()
+    if args.trace:
+        tracer = timing.stop_tracing()
+        tracer.log_summary()
+        tracer.write_trace(args.trace)
+    return {'scenario': args.scenario, 'filers': filers, 'rows': rows, 'wall': wall,
+            'rate': rows / wall if wall else 0.0, 'peak': peak,
+            'concurrency': workers.limit if args.adaptive else None,
+            'calls_per_filer': portal.total_calls() / filers if filers else 0.0,
+            'calls': {name: count / filers for name, count in sorted(portal.calls.items())}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ctools fleet tasks against a mock Portal')
+    parser.add_argument('--scenario', choices=SCENARIOS, default='status', help='Task to benchmark')
+    parser.add_argument('--tenants', type=int, default=10, help='Number of Tenants')
+    parser.add_argument('--filers', type=int, default=100, help='Filers per Tenant')
+    parser.add_argument('--latency', type=float, default=0.0, help='Mean seconds per API call')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Seconds of random jitter per API call')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Probability that a Filer call fails')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--capacity', type=int, help='Calls in flight the mock Portal serves at full speed')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Number of Filers to work on at once')
+    parser.add_argument('--adaptive', action='store_true', help='Adapt concurrency, up to --workers Filers at once')
+    parser.add_argument('--min-workers', type=int, default=1, help='Fewest Filers to work on at once with --adaptive')
+    parser.add_argument('--timeout', type=int, default=DEFAULT_TIMEOUT, help='Seconds allowed per Filer')
+    parser.add_argument('--columns', default='default', help='get_status columns for the status scenario')
+    parser.add_argument('--format', choices=['csv', 'jsonl', 'sqlite'], default='csv', help='status output format')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help="Don't trace memory. Tracing slows the run down")
+    parser.add_argument('--trace', metavar='FILE', help='Log API call timings and save them as a Chrome trace')
+    parser.add_argument('--min-rate', type=float, help='Fail if fewer rows per second than this')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Show task logging')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose or args.trace else logging.ERROR)
+
+    result = benchmark(args)
+    print(f"{result['scenario']}: {result['rows']} rows from {result['filers']} Filers in {result['wall']:.3f}s, "
+          f"{result['rate']:.1f} rows/s")
+    if result['concurrency'] is not None:
+        print(f"final concurrency: {result['concurrency']}")
+    if result['peak'] is not None:
+        print(f"peak traced memory: {result['peak'] / 1024 / 1024:.1f} MiB")
+    print(f"API calls per Filer: {result['calls_per_filer']:.2f}")
+    for name, per_filer in result['calls'].items():
+        print(f"  {name}: {per_filer:.3f}")
+    if args.min_rate and result['rate'] < args.min_rate:
+        print(f"FAIL: {result['rate']:.1f} rows/s is below {args.min_rate:.1f}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import logging
+import os
+import sqlite3
+import time
+
+from filer import get_tenant
+
+DEFAULT_DB = os.path.join(os.path.expanduser('~'), '.ctools', 'breaker.db')
+DEFAULT_COOLDOWN = 6 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS failures (
+    portal TEXT NOT NULL,
+    tenant TEXT NOT NULL,
+    filer TEXT NOT NULL,
+    failures INTEGER NOT NULL,
+    last_error TEXT,
+    open_until REAL,
+    PRIMARY KEY (portal, tenant, filer)
+);
+"""
+
+
+class CircuitBreaker:
+    """
+    Skip Filers that failed in several consecutive runs, across invocations.
+
+    A Filer's failures are counted once per run and kept in a local SQLite
+    database. Once they reach threshold, the Filer is skipped until cooldown
+    seconds have passed. It is then tried again: a success resets it, another
+    failure skips it for another cooldown.
+    """
+
+    def __init__(self, address, threshold, cooldown=DEFAULT_COOLDOWN, path=DEFAULT_DB):
+        self.address = address
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.skipped = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        """Close the database connection."""
+        self._db.close()
+
+    def reason(self, filer):
+        """Return why a Filer should be skipped, or None to try it."""
+        row = self._db.execute(
+            'SELECT failures, last_error, open_until FROM failures WHERE portal = ? AND tenant = ? AND filer = ?',
+            (self.address, get_tenant(filer), filer.name)).fetchone()
+        if row is None or row[2] is None or time.time() >= row[2]:
+            return None
+        self.skipped += 1
+        return f'Skipped after {row[0]} consecutive failed runs until {time.ctime(row[2])}. Last error: {row[1]}'
+
+    def record(self, tenant, filer, error=None):
+        """Record the outcome of a Filer in this run. error is None on success."""
+        with self._db:
+            if error is None:
+                self._db.execute('DELETE FROM failures WHERE portal = ? AND tenant = ? AND filer = ?',
+                                 (self.address, tenant, filer))
+                return
+            row = self._db.execute('SELECT failures FROM failures WHERE portal = ? AND tenant = ? AND filer = ?',
+                                   (self.address, tenant, filer)).fetchone()
+            failures = (row[0] if row else 0) + 1
+            open_until = time.time() + self.cooldown if failures >= self.threshold else None
+            if open_until:
+                logging.warning("%s failed %s runs in a row. Skipping it for %ss.", filer, failures, self.cooldown)
+            self._db.execute(
+                'INSERT OR REPLACE INTO failures (portal, tenant, filer, failures, last_error, open_until) '
+                'VALUES (?, ?, ?, ?, ?, ?)', (self.address, tenant, filer, failures, error, open_until))
@@ -0,0 +1,136 @@
+import csv
+import logging
+from collections import Counter
+
+from filer import FilerEntry, get_handle, has_glob, iter_filers
+from fleet import run_concurrently, Selector, DEFAULT_WORKERS, DEFAULT_TIMEOUT
+from timing import span
+from run_cmd import RESULTS_HEADER, open_results, result_record, write_result
+
+
+def read_device_file(path, default_tenant):
+    """
+    Return FilerEntry references from a device list file.
+    Each line is 'tenant,device' or just 'device' for the default Tenant.
+    get_status and run_cmd CSV output can be used as is: the header is skipped.
+    """
+    entries = []
+    with open(path, newline='', encoding='utf-8-sig') as device_file:
+        for line in csv.reader(device_file):
+            cells = [cell.strip() for cell in line]
+            if not cells or not cells[0] or cells[0].startswith('#') or cells[0] == 'Tenant':
+                continue
+            if len(cells) == 1:
+                entries.append(FilerEntry(default_tenant, cells[0], None))
+            else:
+                entries.append(FilerEntry(cells[0], cells[1], None))
+    return entries
+
+
+def select_devices(self, device_name=None, tenant_name=None, device_file=None, inventory=None, selector=None):
+    """
+    Return FilerEntry references for the devices a bulk task acts on.
+    Devices are given by name, where device and Tenant names may be globs,
+    listed in device_file or chosen with a Selector.
+
+    :param str,optional device_name: Device name, or a glob such as 'vgw-*'
+    :param str,optional tenant_name: Tenant name, or a glob such as '*'. Default the current Tenant
+    :param str,optional device_file: File listing devices, one 'tenant,device' per line
+    :param Inventory,optional inventory: Match globs against cached Filer inventory
+    :param Selector,optional selector: Select by Tenants, device names, firmware and connection state.
+        device_name and tenant_name take precedence over its device names and Tenants, except for '*'
+    """
+    if device_file:
+        if tenant_name and not has_glob(tenant_name):
+            return read_device_file(device_file, tenant_name)
+        return read_device_file(device_file, self.users.session().user.tenant)
+    if not device_name and selector is None:
+        logging.error("No device selected. Give a device name, a glob, a selector or a device file.")
+        return []
+    if selector is None and not has_glob(device_name) and not has_glob(tenant_name):
+        return [FilerEntry(tenant_name or self.users.session().user.tenant, device_name, None)]
+    selector = selector or Selector()
+    # '*' leaves the choice to the selector's device names or Tenants, if it has any.
+    if device_name and not (device_name == '*' and selector.devices):
+        selector = selector._replace(devices=[device_name])
+    if tenant_name and not (tenant_name == '*' and selector.tenants):
+        selector = selector._replace(tenants=[tenant_name])
+    elif selector.tenants is None:
+        selector = selector._replace(tenants=[self.users.session().user.tenant])
+    # Unless the selector says otherwise, globs only match connected Filers, like the other fleet tasks.
+    logging.info("Selecting Filers matching %s", selector)
+    return list(iter_filers(self, True, inventory, selector=selector, compact=True))
+
+
+def print_results(records):
+    """Print a table of result records, one row per device."""
+    rows = [RESULTS_HEADER] + [[str(record[key]) if record[key] is not None else ''
+                                for key in ('tenant', 'filer', 'state', 'response', 'error', 'duration')]
+                               for record in records]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(RESULTS_HEADER))]
+    for row in rows:
+        print('  '.join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip())
+
+
+def run_action(self, description, action, devices, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT,
+               rate=None, results_file=None, confirm=None):
+    """
+    Run an action on many devices concurrently and print a result table.
+    Return a result record for each device.
+
+    :param str description: What the action does, for logging, e.g. 'suspend sync'
+    :param action: Callable taking a device object. Its return value is the response
+    :param list[FilerEntry] devices: Devices to act on
+    :param int,optional workers: Number of devices to act on at once, or an AdaptiveLimit
+    :param int,optional timeout: Seconds allowed per device
+    :param float,optional rate: Maximum devices started per second. Default no limit
+    :param str,optional results_file: CSV or JSONL file to write result records to
+    :param confirm: Optional callable taking a dict of device objects by FilerEntry, for the devices
+        the action succeeded on, once it has run on all of them. It returns a (state, error) tuple
+        by FilerEntry for the devices that didn't take the action after all
+    """
+    handles = {}
+
+    def act(filer):
+        logging.debug("Starting %s on %s", description, filer.name)
+        device = get_handle(self, filer)
+        with span(description, filer.name):
+            response = action(device)
+        handles[filer] = device
+        return 'OK' if response is None else response
+
+    logging.info("Running %s on %s devices", description, len(devices))
+    records = []
+    writer = open_results(results_file) if results_file else None
+    try:
+        spacing = 1 / rate if rate else 0
+        entries = []
+        for result in run_concurrently(act, devices, workers, timeout, spacing):
+            record = result_record(result)
+            records.append(record)
+            entries.append(result.filer)
+            if result.state == 'success':
+                logging.info("Finished %s on %s", description, result.filer.name)
+            elif result.state == 'failed':
+                logging.debug(result.error)
+                logging.warning("Failed %s on %s", description, result.filer.name)
+            if writer and not confirm:
+                write_result(writer, record)
+        if confirm:
+            # Records are only final, and written, once the devices are confirmed.
+            unconfirmed = confirm({entry: handles[entry] for entry, record in zip(entries, records)
+                                   if record['state'] == 'success'})
+            for entry, record in zip(entries, records):
+                if entry in unconfirmed:
+                    record['state'], record['error'] = unconfirmed[entry]
+                    record['response'] = None
+                if writer:
+                    write_result(writer, record)
+    finally:
+        if writer:
+            writer.close()
+    print_results(records)
+    states = Counter(record['state'] for record in records)
+    logging.info("Results of %s: %s succeeded, %s failed, %s timed out",
+                 description, states['success'], states['failed'], states['timeout'])
+    return records
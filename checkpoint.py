@@ -0,0 +1,99 @@
+import logging
+import os
+import sqlite3
+import time
+
+from filer import get_tenant
+
+CHECKPOINT_EVERY = 50
+DEFAULT_DIR = os.path.join(os.path.expanduser('~'), '.ctools')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sweep (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    key TEXT NOT NULL,
+    started REAL NOT NULL,
+    completed REAL
+);
+CREATE TABLE IF NOT EXISTS done (
+    tenant TEXT NOT NULL,
+    filer TEXT NOT NULL,
+    PRIMARY KEY (tenant, filer)
+);
+"""
+
+
+class Checkpoint:
+    """
+    Filers completed in the current sweep, so an interrupted sweep can resume.
+
+    Completed Filers are marked as their results are written and committed
+    in batches, after the output has been flushed, so a resumed sweep skips
+    exactly the Filers whose results are already saved. The checkpoint is
+    removed once the sweep completes.
+
+    :param str path: Checkpoint database
+    :param str key: What the sweep does, e.g. the output file or command. A checkpoint is only resumed for the same key
+    :param bool resume: Continue an unfinished sweep instead of starting a new one
+    """
+
+    def __init__(self, path, key, resume=False):
+        self.path = path
+        self.key = key
+        self.done = set()
+        self._pending = []
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.executescript(SCHEMA)
+        sweep = self._db.execute('SELECT key, started, completed FROM sweep WHERE id = 1').fetchone()
+        if resume and sweep and sweep[0] == key and sweep[2] is None:
+            self.done = set(self._db.execute('SELECT tenant, filer FROM done'))
+            logging.info("Resuming sweep started %s. Skipping %s completed Filers.", time.ctime(sweep[1]), len(self.done))
+            return
+        if resume:
+            logging.info("No unfinished sweep to resume in %s. Starting a new sweep.", path)
+        with self._db:
+            self._db.execute('DELETE FROM done')
+            self._db.execute('INSERT OR REPLACE INTO sweep (id, key, started, completed) VALUES (1, ?, ?, NULL)',
+                             (key, time.time()))
+
+    @property
+    def pending(self):
+        """Number of marked Filers not committed yet."""
+        return len(self._pending)
+
+    def filter(self, filers):
+        """Yield the filers not completed yet in this sweep."""
+        for filer in filers:
+            if (get_tenant(filer), filer.name) in self.done:
+                logging.debug("Already completed %s", filer.name)
+                continue
+            yield filer
+
+    def mark(self, tenant, filer):
+        """Mark a Filer completed. Commit once its result is flushed to the output."""
+        self._pending.append((tenant, filer))
+
+    def commit(self):
+        """Save marked Filers. Call after flushing their results."""
+        if self._db is not None and self._pending:
+            with self._db:
+                self._db.executemany('INSERT OR IGNORE INTO done (tenant, filer) VALUES (?, ?)', self._pending)
+            self.done.update(self._pending)
+            self._pending = []
+
+    def complete(self):
+        """Finish the sweep and remove the checkpoint, so the next run starts a new sweep."""
+        self.commit()
+        with self._db:
+            self._db.execute('UPDATE sweep SET completed = ? WHERE id = 1', (time.time(),))
+        self.close()
+        os.remove(self.path)
+
+    def close(self):
+        """Close the checkpoint database."""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,247 @@
+import json
+from collections import namedtuple
+
+from filer import get_tenant
+from output import to_json
+from perfstats import sample_stats
+
+NOT_APPLICABLE = 'Not Applicable'
+
+# A status record field.
+# paths: get_multi paths the field is read from
+# calls: extra requests made to read the field
+# extract: function of (filer, info) returning the field value
+# key: if set, extract returns a dict shared by several fields and the field is this key of it
+Field = namedtuple('Field', ['paths', 'calls', 'extract', 'key'], defaults=[None])
+
+# An output column. format turns a record into the CSV cell for the column.
+Column = namedtuple('Column', ['header', 'fields', 'format'])
+
+
+def attr(path):
+    """Return an extractor for a dotted attribute path of the get_multi response."""
+    def extract(filer, info):  # pylint: disable=unused-argument
+        value = info
+        for name in path.split('.'):
+            value = getattr(value, name)
+        return value
+    return extract
+
+
+def optional_attr(*paths):
+    """Return an extractor for the first dotted path that exists, else None."""
+    extractors = [attr(path) for path in paths]
+
+    def extract(filer, info):
+        for extractor in extractors:
+            try:
+                return extractor(filer, info)
+            except AttributeError:
+                continue
+        return None
+    return extract
+
+
+def get_metalogs_setting(filer, info):  # pylint: disable=unused-argument
+    """Return the metalog debug level from the dbg level CLI command."""
+    try:
+        MetaLogs = filer.cli.run_command('dbg level')
+        return MetaLogs[-28:-18]
+    except AttributeError:
+        return None
+
+
+def get_ad_status(filer, info):  # pylint: disable=unused-argument
+    """
+    Parse domain join value and return the Domain Join Status as string.
+    joinStatus: -1 = workgroup, 0 = OK, 2 = Failed
+    """
+    result = info.status.fileservices.cifs.joinStatus
+    if result == 0:
+        return 'Ok'
+    if result == -1:
+        return 'Workgroup'
+    if result == 2:
+        return 'Failed'
+    return result
+
+
+def get_first_port(name):
+    """Return an extractor for an IP setting of the first network port."""
+    def extract(filer, info):  # pylint: disable=unused-argument
+        return getattr(info.status.network.ports[0].ip, name)
+    return extract
+
+
+FIELDS = {
+    'tenant': Field([], [], lambda filer, info: get_tenant(filer)),
+    'filer': Field([], [], lambda filer, info: filer.name),
+    'sync_status': Field(['proc/cloudsync'], [], attr('proc.cloudsync.serviceStatus.id')),
+    'self_scan_interval_hours': Field(['config'], [], optional_attr('config.cloudsync.selfScanVerificationIntervalInHours')),
+    'uploading_files': Field(['proc/cloudsync'], [], attr('proc.cloudsync.serviceStatus.uploadingFiles')),
+    'scanning_files': Field(['proc/cloudsync'], [], attr('proc.cloudsync.serviceStatus.scanningFiles')),
+    'self_verification_scanning_files': Field(['proc/cloudsync'], [],
+                                              optional_attr('proc.cloudsync.serviceStatus.selfVerificationScanningFiles')),
+    'metalogs_setting': Field([], ['dbg level'], get_metalogs_setting),
+    'metalog_max_size': Field(['config'], [], optional_attr('config.logging.metalog.maxFileSizeMB',
+                                                            'config.logging.log2File.maxFileSizeMB')),
+    'metalog_max_files': Field(['config'], [], optional_attr('config.logging.metalog.maxfiles',
+                                                             'config.logging.log2File.maxfiles')),
+    'firmware': Field(['status'], [], attr('status.device.runningFirmware')),
+    # License = info.config.device.activeLicenseType
+    'license': Field([], ['licenses.get'], lambda filer, info: filer.licenses.get()),
+    'eviction_percentage': Field(['config'], [],
+                                 optional_attr('config.cloudsync.cloudExtender.storageThresholdPercentTrigger')),
+    'volume_total': Field(['proc/storage/summary'], [], attr('proc.storage.summary.totalVolumeSpace')),
+    'volume_used': Field(['proc/storage/summary'], [], attr('proc.storage.summary.usedVolumeSpace')),
+    'volume_free': Field(['proc/storage/summary'], [], attr('proc.storage.summary.freeVolumeSpace')),
+    'ip': Field(['status'], [], get_first_port('address')),
+    'dns1': Field(['status'], [], get_first_port('DNSServer1')),
+    'dns2': Field(['status'], [], get_first_port('DNSServer2')),
+    'ad_status': Field(['status'], [], get_ad_status),
+    'alerts': Field(['config'], [], attr('config.logging.alert')),
+    'ntp_mode': Field(['config'], [], attr('config.time.NTPMode')),
+    'time_zone': Field(['config'], [], attr('config.time.TimeZone')),
+    'ntp_servers': Field(['config'], [], attr('config.time.NTPServer')),
+    'uptime': Field(['proc/time/'], [], attr('proc.time.uptime')),
+    'cpu': Field(['proc/perfMonitor'], [], attr('proc.perfMonitor.current.cpu')),
+    'memory': Field(['proc/perfMonitor'], [], attr('proc.perfMonitor.current.memUsage')),
+    # Taken from the sample statistics below, so the samples are only scanned once.
+    'max_cpu': Field(['proc/perfMonitor'], [], sample_stats, 'cpu_max'),
+    'max_memory': Field(['proc/perfMonitor'], [], sample_stats, 'memory_max'),
+    # Why the Filer's status couldn't be collected. Always None in collected records.
+    'error': Field([], [], lambda filer, info: None),
+    # Raw (timestamp, cpu, memory) samples for the sample archive. Not shown in any column.
+    'perf_samples': Field(['proc/perfMonitor'], [], lambda filer, info: [
+        (i.timestamp, i.cpu, i.memUsage) for i in info.proc.perfMonitor.samples]),
+}
+# perfMonitor sample statistics, computed together in one pass per Filer.
+FIELDS.update((f'{metric}_{stat}', Field(['proc/perfMonitor'], [], sample_stats, f'{metric}_{stat}'))
+              for metric in ('cpu', 'memory') for stat in ('mean', 'p50', 'p95', 'above'))
+
+# Fields read from the config subtree or from extra calls.
+# Incremental sweeps can reuse these from the previous snapshot.
+SETTINGS_FIELDS = [name for name, field in FIELDS.items() if 'config' in field.paths or field.calls]
+
+
+def value_of(name):
+    """Return a formatter for a column holding a single field."""
+    return lambda record: record[name]
+
+
+def as_text(name):
+    """
+    Return a formatter for a field holding an SDK object, printed as JSON like the SDK prints it.
+    Settings reused from an incremental snapshot are plain dicts, which print the same.
+    """
+    def format_value(record):
+        value = record[name]
+        if value is None or isinstance(value, str):
+            return value
+        return json.dumps(value, default=to_json, indent=5)
+    return format_value
+
+
+def applicable(name):
+    """Return a formatter for an optional field, showing None as Not Applicable."""
+    return lambda record: NOT_APPLICABLE if record[name] is None else record[name]
+
+
+COLUMNS = {
+    'tenant': Column('Tenant', ['tenant'], value_of('tenant')),
+    'filer': Column('Filer Name', ['filer'], value_of('filer')),
+    'sync_status': Column('CloudSync Status', ['sync_status'], value_of('sync_status')),
+    'self_scan_interval_hours': Column('selfScanIntervalInHours', ['self_scan_interval_hours'],
+                                       applicable('self_scan_interval_hours')),
+    'uploading_files': Column('uploadingFiles', ['uploading_files'], value_of('uploading_files')),
+    'scanning_files': Column('scanningFiles', ['scanning_files'], value_of('scanning_files')),
+    'self_verification_scanning_files': Column('selfVerificationscanningFiles', ['self_verification_scanning_files'],
+                                               applicable('self_verification_scanning_files')),
+    'metalogs_setting': Column('MetaLogsSetting', ['metalogs_setting'], applicable('metalogs_setting')),
+    'metalog_max_size': Column('MetaLogMaxSize', ['metalog_max_size'], applicable('metalog_max_size')),
+    'metalog_max_files': Column('MetaLogMaxFiles', ['metalog_max_files'], applicable('metalog_max_files')),
+    'firmware': Column('CurrentFirmware', ['firmware'], value_of('firmware')),
+    'license': Column('License', ['license'], value_of('license')),
+    'eviction_percentage': Column('EvictionPercentage', ['eviction_percentage'], applicable('eviction_percentage')),
+    'volume': Column('CurrentVolumeStorage', ['volume_total', 'volume_used', 'volume_free'], lambda record: (
+        f"Total: {record['volume_total']} Used: {record['volume_used']} Free: {record['volume_free']}")),
+    'ip': Column('IP Config', ['ip'], value_of('ip')),
+    'dns1': Column('DNS Server1', ['dns1'], value_of('dns1')),
+    'dns2': Column('DNS Server2', ['dns2'], value_of('dns2')),
+    'ad_status': Column('AD Domain Status', ['ad_status'], value_of('ad_status')),
+    'alerts': Column('Alerts', ['alerts'], as_text('alerts')),
+    'time_server': Column('TimeServer', ['ntp_mode', 'time_zone', 'ntp_servers'], lambda record: (
+        f"Mode: {record['ntp_mode']} Zone: {record['time_zone']} Servers: {record['ntp_servers']}")),
+    'uptime': Column('uptime', ['uptime'], value_of('uptime')),
+    'performance': Column('Current Performance', ['cpu', 'memory'],
+                          lambda record: f"CPU: {record['cpu']}% Mem: {record['memory']}%"),
+    'max_cpu': Column('Max CPU', ['max_cpu'], lambda record: f"{record['max_cpu']}%"),
+    'max_memory': Column('Max Memory', ['max_memory'], lambda record: f"{record['max_memory']}%"),
+    'cpu_stats': Column('CPU Stats', ['cpu_mean', 'cpu_p50', 'cpu_p95', 'cpu_above'], lambda record: (
+        f"Mean: {record['cpu_mean']}% P50: {record['cpu_p50']}% P95: {record['cpu_p95']}% Above: {record['cpu_above']}%")),
+    'memory_stats': Column('Memory Stats', ['memory_mean', 'memory_p50', 'memory_p95', 'memory_above'], lambda record: (
+        f"Mean: {record['memory_mean']}% P50: {record['memory_p50']}% P95: {record['memory_p95']}% "
+        f"Above: {record['memory_above']}%")),
+    'error': Column('Error', ['error'], value_of('error')),
+}
+
+# Named column selections. Tenant and Filer Name are always included.
+COLUMN_SETS = {
+    'default': [name for name in COLUMNS if name not in ('cpu_stats', 'memory_stats')],
+    'all': list(COLUMNS),
+    'stats': ['cpu_stats', 'memory_stats'],
+    'sync': ['sync_status', 'uploading_files', 'scanning_files', 'self_verification_scanning_files'],
+    'performance': ['uptime', 'performance', 'max_cpu', 'max_memory'],
+    'storage': ['eviction_percentage', 'volume'],
+    'network': ['ip', 'dns1', 'dns2', 'ad_status'],
+    'settings': ['self_scan_interval_hours', 'metalogs_setting', 'metalog_max_size', 'metalog_max_files',
+                 'firmware', 'license', 'alerts', 'time_server'],
+}
+
+
+def select_columns(spec=None):
+    """
+    Return column names for a comma separated list of column and column set names,
+    in COLUMNS order. Raise ValueError for unknown names.
+    """
+    selected = {'tenant', 'filer'}
+    for name in (spec or 'default').split(','):
+        name = name.strip()
+        if name in COLUMN_SETS:
+            selected.update(COLUMN_SETS[name])
+        elif name in COLUMNS:
+            selected.add(name)
+        else:
+            raise ValueError(f"Unknown column '{name}'. Choose from {', '.join(list(COLUMN_SETS) + list(COLUMNS))}")
+    return [name for name in COLUMNS if name in selected]
+
+
+def header(columns):
+    """Return the CSV header for selected columns."""
+    return [COLUMNS[name].header for name in columns]
+
+
+def fields_for(columns):
+    """Return the record fields needed for selected columns, in FIELDS order."""
+    needed = {field for name in columns for field in COLUMNS[name].fields}
+    return [name for name in FIELDS if name in needed]
+
+
+def paths_for(fields):
+    """Return the smallest get_multi path list for given fields."""
+    paths = []
+    for name in fields:
+        for path in FIELDS[name].paths:
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def row(record, columns):
+    """
+    Format a status record as a CSV row for selected columns.
+    A failed Filer's record only fills Tenant, Filer Name and Error.
+    """
+    if record.get('error') is not None:
+        return [COLUMNS[name].format(record) if name in ('tenant', 'filer', 'error') else None for name in columns]
+    return [COLUMNS[name].format(record) for name in columns]
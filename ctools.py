@@ -1,80 +1,154 @@
+import argparse
+import atexit
+import importlib
+import json
 import logging
+import sys
 from getpass import getpass
 
-from gooey import Gooey, GooeyParser
+from session_cache import SessionCache
+from fleet import (AdaptiveLimit, DEFAULT_WORKERS, DEFAULT_TIMEOUT, DEFAULT_INVENTORY_TTL, DEFAULT_RETRIES, STATES,
+                   make_selector, parse_shard)
+from output import FORMATS, DEFAULT_FLUSH_ROWS, DEFAULT_FLUSH_BYTES
+from delta import DEFAULT_FULL_EVERY, DEFAULT_CONFIG_EVERY
 
-from login import global_admin_login
-from status import run_status
-from unlock import enable_telnet, start_ssh, disable_ssh
-from run_cmd import run_cmd
-from suspend_sync import suspend_filer_sync
-from unsuspend_sync import unsuspend_filer_sync
-from reset_password import reset_filer_password
+# Map task names to the module and function implementing them.
+# Task modules, and cterasdk with them, are only imported once a task is selected.
+FUNCTION_MAP = {'get_status': ('status', 'run_status'),
+                'run_cmd': ('run_cmd', 'run_cmd'),
+                'watch': ('watch', 'watch'),
+                'enable_telnet': ('unlock', 'enable_telnet'),
+                'enable_ssh': ('unlock', 'start_ssh'),
+                'disable_ssh': ('unlock', 'disable_ssh'),
+                'suspend_sync': ('suspend_sync', 'suspend_filer_sync'),
+                'unsuspend_sync': ('unsuspend_sync', 'unsuspend_filer_sync'),
+                'reset_password': ('reset_password', 'reset_filer_password'),
+                'query_status': ('history', 'query_status'),
+                'query_samples': ('archive', 'query_samples'),
+                'merge': ('merge', 'merge_outputs'),
+                }
+# Tasks that work on local files and don't log into a Portal.
+LOCAL_TASKS = ['query_status', 'query_samples', 'merge']
 
+LOG_FORMATS = ['text', 'json']
+# Rotated log files kept with --log-max-mb
+LOG_BACKUPS = 5
+_log_listener = None
 
-def set_logging(p_level=logging.INFO, log_file="info-log.txt"):
+# Gooey decorator options, only used when the GUI is launched.
+GOOEY_OPTIONS = dict(
+    advanced=True, navigation='TABBED', program_name="CTools", use_cmd_args=True,
+    default_size=(800, 750),
+    menu=[{
+        'name': 'File',
+        'items': [{
+            'type': 'AboutDialog',
+            'menuTitle': 'About',
+            'name': 'CTools',
+            'description': 'A toolbox of tasks to check and manage CTERA Edge Filers.',
+            'version': 'v2.1a',
+            'copyright': '2021',
+            'website': 'https://github.com/ctera/ctools/tree/todd/gooey',
+            'license': 'TBD'
+            }, {
+            'type': 'Link',
+            'menuTitle': 'Visit Our Site',
+            'url': 'https://www.ctera.com/'
+            }]}, {
+        'name': 'Help',
+        'items': [{
+            'type': 'Link',
+            'menuTitle': 'CTERA Support',
+            'url': 'https://support.ctera.com/'
+            }, {
+            'type': 'Link',
+            'menuTitle': 'Open a CTools Issue',
+            'url': 'https://github.com/ctera/ctools/issues'}]}])
+
+
+class CliParser(argparse.ArgumentParser):
+    """ArgumentParser that accepts and ignores GooeyParser-only keywords."""
+
+    def add_argument(self, *args, **kwargs):
+        kwargs.pop('widget', None)
+        kwargs.pop('gooey_options', None)
+        return super().add_argument(*args, **kwargs)
+
+
+def load_task(task):
+    """Import the module for a task and return its function."""
+    module_name, function_name = FUNCTION_MAP[task]
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+class JsonFormatter(logging.Formatter):
+    """Format each log record as a JSON object on one line."""
+
+    def format(self, record):
+        entry = {'time': self.formatTime(record), 'level': record.levelname, 'thread': record.threadName,
+                 'message': record.getMessage()}
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+def stop_logging():
+    """Stop the background log listener, if any, writing out records still queued."""
+    global _log_listener  # pylint: disable=global-statement
+    if _log_listener:
+        _log_listener.stop()
+        _log_listener = None
+
+
+def set_logging(p_level=logging.INFO, log_file="info-log.txt", log_format='text', max_mb=0, use_queue=False):
     """
     Set up logging to a given file name.
     Doesn't require CTERASDK_LOG_FILE to be set.
 
     p_level --  DEBUG, INFO, WARNING, ERROR, Critical. (default INFO)
     log_file -- file name for log file. (default "log.txt")
+    log_format -- 'text', or 'json' for one JSON object per line. (default 'text')
+    max_mb -- rotate the log file at this size, keeping LOG_BACKUPS old files. (default 0, never)
+    use_queue -- write records from a background thread, so tasks never wait on log I/O. (default False)
     """
+    global _log_listener  # pylint: disable=global-statement
+    stop_logging()
+    if max_mb or use_queue:
+        # Only imported when used, as they slow down CLI startup.
+        import queue  # pylint: disable=import-outside-toplevel
+        from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler  # pylint: disable=import-outside-toplevel
+    if max_mb:
+        file_handler = RotatingFileHandler(log_file, maxBytes=int(max_mb * 1024 * 1024), backupCount=LOG_BACKUPS)
+    else:
+        file_handler = logging.FileHandler(log_file)
+    handlers = [file_handler, logging.StreamHandler()]
+    formatter = JsonFormatter() if log_format == 'json' else logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    if use_queue:
+        log_queue = queue.SimpleQueue()
+        _log_listener = QueueListener(log_queue, *handlers)
+        _log_listener.start()
+        atexit.register(stop_logging)
+        queue_handler = QueueHandler(log_queue)
+        queue_handler.setFormatter(logging.Formatter("%(message)s"))
+        handlers = [queue_handler]
     logging.root.handlers = []
-    logging.basicConfig(
-        level=p_level,
-        format="%(asctime)s [%(levelname)s] %(message)s",
-        handlers=[
-            logging.FileHandler(log_file),
-            logging.StreamHandler()])
-
-
-@Gooey(advanced=True, navigation='TABBED', program_name="CTools", use_cmd_args=True,
-       default_size=(800, 750),
-       menu=[{
-            'name': 'File',
-            'items': [{
-                    'type': 'AboutDialog',
-                    'menuTitle': 'About',
-                    'name': 'CTools',
-                    'description': 'A toolbox of tasks to check and manage CTERA Edge Filers.',
-                    'version': 'v2.1a',
-                    'copyright': '2021',
-                    'website': 'https://github.com/ctera/ctools/tree/todd/gooey',
-                    'license': 'TBD'
-                    }, {
-                    'type': 'Link',
-                    'menuTitle': 'Visit Our Site',
-                    'url': 'https://www.ctera.com/'
-                    }]},
-             {'name': 'Help',
-              'items': [{
-                    'type': 'Link',
-                    'menuTitle': 'CTERA Support',
-                    'url': 'https://support.ctera.com/'
-                   }, {
-                    'type': 'Link',
-                    'menuTitle': 'Open a CTools Issue',
-                    'url': 'https://github.com/ctera/ctools/issues'}]}])
-def main():
+    logging.basicConfig(level=p_level, handlers=handlers)
+
+
+def main(parser_class=CliParser):
     """
-    Create dictionary mapping task names to functions.
     Add parent parser(s) for re-use in task sub parsers.
     Add a subparser to present options based on chosen task.
+    Then load and run the chosen task from FUNCTION_MAP.
+
+    :param parser_class: GooeyParser for the GUI, else a plain CliParser
     """
-    FUNCTION_MAP = {'get_status': run_status,
-                    'run_cmd': run_cmd,
-                    'enable_telnet': enable_telnet,
-                    'enable_ssh': start_ssh,
-                    'disable_ssh': disable_ssh,
-                    'suspend_sync': suspend_filer_sync,
-                    'unsuspend_sync': unsuspend_filer_sync,
-                    'reset_password': reset_filer_password,
-                    }
-    parser = GooeyParser(description='Manage CTERA Edge Filers')
+    parser = parser_class(description='Manage CTERA Edge Filers')
     parser.add_argument('--ignore-gooey', help='Run in CLI mode')
     # Parent Parser for tasks requiring portal logins.
-    portal_parent_parser = GooeyParser(add_help=False)
+    portal_parent_parser = parser_class(add_help=False)
     portal_parent_parser.add_argument('address', help='Portal IP, hostname, or FQDN')
     portal_parent_parser.add_argument('username', help='Username for portal administrator')
     # This makes password required.
@@ -86,25 +160,117 @@ def main():
     # If not specified/checked, default to INFO level.
     portal_parent_parser.add_argument('-v', '--verbose', help='Add verbose logging', action='store_true')
     portal_parent_parser.add_argument('-i', '--ignore_cert', help='Ignore cert warnings', action='store_true')
+    portal_parent_parser.add_argument('-s', '--session-cache', action='store_true',
+                                      help='Reuse a cached Portal session and keep it open on exit')
+    portal_parent_parser.add_argument('--log-format', choices=LOG_FORMATS, default='text',
+                                      help='Log as text, or as one JSON object per line')
+    portal_parent_parser.add_argument('--log-max-mb', type=float, default=0,
+                                      help=f'Rotate the log file at this size, keeping {LOG_BACKUPS} old files. 0 to never rotate')
+    portal_parent_parser.add_argument('--log-async', action='store_true',
+                                      help='Write log records from a background thread, so Filer work never waits on log I/O')
+    portal_parent_parser.add_argument('--timings', action='store_true',
+                                      help='Log time per API call type and the slowest Filers at the end')
+    portal_parent_parser.add_argument('--trace', metavar='FILE',
+                                      help='Save API call timings as a Chrome trace JSON file. Implies --timings')
+
+    # Parent Parser for tasks that work across many Filers.
+    fleet_parent_parser = parser_class(add_help=False)
+    fleet_parent_parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS, help='Number of Filers to work on at once')
+    fleet_parent_parser.add_argument('--adaptive', action='store_true',
+                                     help='Adjust the Filers worked on at once to Portal latency and errors, up to --workers')
+    fleet_parent_parser.add_argument('--min-workers', type=int, default=1,
+                                     help='Fewest Filers to work on at once with --adaptive')
+    fleet_parent_parser.add_argument('-t', '--timeout', type=int, default=DEFAULT_TIMEOUT, help='Seconds allowed per Filer. 0 to disable')
+    fleet_parent_parser.add_argument('-c', '--cache-inventory', action='store_true', help='Use a local cache of connected Filers')
+    fleet_parent_parser.add_argument('--inventory-ttl', type=int, default=DEFAULT_INVENTORY_TTL,
+                                     help='Seconds before a cached Tenant is listed again')
+    fleet_parent_parser.add_argument('--refresh-inventory', action='store_true',
+                                     help='List all Tenants again and update the local cache')
+    fleet_parent_parser.add_argument('--tenants', help='Only these Tenants. Comma separated names or globs, e.g. acme,dev-*')
+    fleet_parent_parser.add_argument('--devices', help='Only these Filers. Comma separated names or globs, e.g. vgw-*')
+    fleet_parent_parser.add_argument('--firmware', help='Only Filers running this firmware version or glob, e.g. 7.5.*')
+    fleet_parent_parser.add_argument('--state', choices=STATES, default='connected',
+                                     help='Only Filers in this connection state')
+    # Parent parser for sweeps that retry, skip failing Filers, resume and shard
+    retry_parent_parser = parser_class(add_help=False)
+    retry_parent_parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES,
+                                     help='Retries per Filer for connection errors, timeouts and 429/5xx responses')
+    retry_parent_parser.add_argument('--breaker-threshold', type=int, default=0,
+                                     help='Skip Filers that failed this many runs in a row. 0 to disable')
+    retry_parent_parser.add_argument('--breaker-cooldown', type=int, default=6 * 3600,
+                                     help='Seconds to skip a failing Filer before trying it again')
+    retry_parent_parser.add_argument('--resume', action='store_true',
+                                     help='Continue the last unfinished sweep, skipping Filers already completed')
+    retry_parent_parser.add_argument('--shard', type=parse_shard, metavar='INDEX/COUNT',
+                                     help='Only this slice of the Filers, e.g. 3/8. Combine shard outputs with merge')
+    sweep_parents = [portal_parent_parser, fleet_parent_parser, retry_parent_parser]
+    # Parent parser for device tasks that can act on many devices at once
+    bulk_parent_parser = parser_class(add_help=False)
+    bulk_parent_parser.add_argument('-f', '--device-file',
+                                    help="Device list file, one 'tenant,device' or 'device' per line. Give * as device_name")
+    bulk_parent_parser.add_argument('-r', '--rate', type=float, help='Maximum devices started per second')
+    bulk_parent_parser.add_argument('-o', '--output', help='CSV or JSONL file to save a result record per device')
+    device_parents = [portal_parent_parser, fleet_parent_parser, bulk_parent_parser]
+    device_name_help = 'Device Name, or a glob such as vgw-*. * to select with --devices or --device-file'
+    tenant_name_help = 'Tenant Name, or a glob such as *. * to select with --tenants'
 
     # Create a subparser
     subs = parser.add_subparsers(help='Task choices.', dest='task')
 
     # Filer Status sub parser
     status_help = "Record current status of connected Filers."
-    status_parser = subs.add_parser('get_status', parents=[portal_parent_parser], help=status_help)
+    status_parser = subs.add_parser('get_status', parents=sweep_parents, help=status_help)
     status_parser.add_argument('filename', type=str, help='output filename')
     status_parser.add_argument('-a', '--all', action='store_true', help='All Filers, All Tenants')
+    status_parser.add_argument('-f', '--format', choices=FORMATS, help='Output format. Default based on filename, else csv')
+    status_parser.add_argument('-z', '--gzip', action='store_true', help='Compress output with gzip. Default if filename ends in .gz')
+    status_parser.add_argument('--flush-rows', type=int, default=DEFAULT_FLUSH_ROWS, help='Rows to buffer before writing to file')
+    status_parser.add_argument('--flush-bytes', type=int, default=DEFAULT_FLUSH_BYTES, help='Bytes to buffer before writing to file')
+    status_parser.add_argument('--columns', default='default',
+                               help='Comma separated columns or column sets: default, all, sync, performance, stats, storage, '
+                                    'network, settings')
+    status_parser.add_argument('--perf-threshold', type=float, default=80.0,
+                               help='Percent CPU or memory counted as time above threshold in stats columns')
+    status_parser.add_argument('--rollup', help='JSON file to save the fleet performance rollup when stats columns are selected')
+    status_parser.add_argument('--archive', metavar='DIR',
+                               help='Directory to archive raw perfMonitor samples, without duplicates across sweeps')
+    status_parser.add_argument('--incremental', action='store_true',
+                               help='Reuse unchanged config from the last sweep. JSONL output only records changed fields')
+    status_parser.add_argument('--full-every', type=int, default=DEFAULT_FULL_EVERY,
+                               help='Incremental sweeps between full snapshots')
+    status_parser.add_argument('--config-every', type=int, default=DEFAULT_CONFIG_EVERY,
+                               help='Incremental sweeps between config fetches')
 
     # Run device command sub parser
     cmd_help = "Run a comand on one or more connected Filers."
     all_help = "Run a command globally, on all Filers, on all Tenants."
     device_help = "Device name to run command against. Overrides --all flag."
 
-    cmd_parser = subs.add_parser('run_cmd', parents=[portal_parent_parser], help=cmd_help)
-    cmd_parser.add_argument('command', type=str, help=cmd_help)
+    cmd_parser = subs.add_parser('run_cmd', parents=sweep_parents, help=cmd_help)
+    cmd_parser.add_argument('command', type=str, nargs='?',
+                            help='Command to run on each Filer. Quote it if it has spaces. Optional with --script')
     cmd_parser.add_argument('-a', '--all', action='store_true', help=all_help)
     cmd_parser.add_argument('-d', '--device', help=device_help)
+    cmd_parser.add_argument('-o', '--output', help='CSV or JSONL file to save a result record per Filer and command')
+    cmd_parser.add_argument('--command', dest='commands', action='append', metavar='COMMAND',
+                            help='Another command to run after command. Repeat for more')
+    cmd_parser.add_argument('--script',
+                            help='File of commands to run after any given ones, one per line. Enough on its own')
+    cmd_parser.add_argument('--stop-on-error', action='store_true',
+                            help="Skip the rest of a Filer's commands after one fails")
+    cmd_parser.add_argument('--group', action='store_true',
+                            help='Log groups of Filers with identical responses instead of each response')
+    cmd_parser.add_argument('--group-file', help='JSON file to save response groups and their Filers to. Implies --group')
+
+    # Watch sub parser
+    watch_help = "Poll Filers on a schedule and serve their latest metrics for Prometheus."
+    watch_parser = subs.add_parser('watch', parents=[portal_parent_parser, fleet_parent_parser], help=watch_help)
+    watch_parser.add_argument('-a', '--all', action='store_true', help='All Filers, All Tenants')
+    watch_parser.add_argument('-n', '--interval', type=int, default=300, help='Seconds between sweeps')
+    watch_parser.add_argument('-p', '--port', type=int, default=9810, help='Port to serve /metrics on')
+    watch_parser.add_argument('-b', '--bind', default='127.0.0.1', help='Address to serve /metrics on')
+    watch_parser.add_argument('-o', '--output', help='Also record each sweep to this file, e.g. status.db')
+    watch_parser.add_argument('--sweeps', type=int, help='Stop after this many sweeps. Default run until interrupted')
 
     # Enable Telnet sub parser
     enable_telnet_help = "Enable SSH on a Filer."
@@ -115,77 +281,181 @@ def main():
 
     # Enable SSH sub parser
     enable_ssh_help = "Enable SSH on a Filer."
-    enable_ssh_parser = subs.add_parser('enable_ssh', parents=[portal_parent_parser], help=enable_ssh_help)
-    enable_ssh_parser.add_argument('device_name', help='Device Name')
-    enable_ssh_parser.add_argument('tenant_name', help='Tenant Name')
+    enable_ssh_parser = subs.add_parser('enable_ssh', parents=device_parents, help=enable_ssh_help)
+    enable_ssh_parser.add_argument('device_name', help=device_name_help)
+    enable_ssh_parser.add_argument('tenant_name', help=tenant_name_help)
     enable_ssh_parser.add_argument('-p', '--pubkey', help='Provide an SSH Public Key')
 
     # Disable SSH sub parser
     disable_ssh_help = "Disable SSH on a Filer."
-    disable_ssh_parser = subs.add_parser('disable_ssh', parents=[portal_parent_parser], help=disable_ssh_help)
-    disable_ssh_parser.add_argument('device_name', help='Device Name')
-    disable_ssh_parser.add_argument('tenant_name', help='Tenant Name')
+    disable_ssh_parser = subs.add_parser('disable_ssh', parents=device_parents, help=disable_ssh_help)
+    disable_ssh_parser.add_argument('device_name', help=device_name_help)
+    disable_ssh_parser.add_argument('tenant_name', help=tenant_name_help)
 
     # Suspend sync sub parser
     suspend_sync_help = "Suspend sync on a given Filer"
-    suspend_sync_parser = subs.add_parser('suspend_sync', parents=[portal_parent_parser], help=suspend_sync_help)
-    suspend_sync_parser.add_argument('device_name', help='Device Name')
-    suspend_sync_parser.add_argument('tenant_name', help='Tenant Name')
+    suspend_sync_parser = subs.add_parser('suspend_sync', parents=device_parents, help=suspend_sync_help)
+    suspend_sync_parser.add_argument('device_name', help=device_name_help)
+    suspend_sync_parser.add_argument('tenant_name', help=tenant_name_help)
 
     # Suspend sync sub parser
     unsuspend_sync_help = "Unsuspend sync on a given Filer"
-    unsuspend_sync_parser = subs.add_parser('unsuspend_sync', parents=[portal_parent_parser], help=unsuspend_sync_help)
-    unsuspend_sync_parser.add_argument('device_name', help='Device Name')
-    unsuspend_sync_parser.add_argument('tenant_name', help='Tenant Name')
+    unsuspend_sync_parser = subs.add_parser('unsuspend_sync', parents=device_parents, help=unsuspend_sync_help)
+    unsuspend_sync_parser.add_argument('device_name', help=device_name_help)
+    unsuspend_sync_parser.add_argument('tenant_name', help=tenant_name_help)
 
     # Reset Filer sub parser
     reset_pw_help_text = "Reset a user password on a Filer"
     new_pw_help_text = 'New Filer Password. Enter ? to prompt in CLI'
-    reset_password_parser = subs.add_parser('reset_password', parents=[portal_parent_parser], help=reset_pw_help_text)
-    reset_password_parser.add_argument('device_name', help='Device Name')
-    reset_password_parser.add_argument('tenant_name', help='Tenant Name')
+    reset_password_parser = subs.add_parser('reset_password', parents=device_parents, help=reset_pw_help_text)
+    reset_password_parser.add_argument('device_name', help=device_name_help)
+    reset_password_parser.add_argument('tenant_name', help=tenant_name_help)
     reset_password_parser.add_argument('user_name', help='User Name')
     reset_password_parser.add_argument('filer_password', widget='PasswordField', help=new_pw_help_text)
 
+    # Query status history sub parser
+    query_help = "Query status history recorded by get_status in sqlite format."
+    query_parser = subs.add_parser('query_status', help=query_help)
+    query_parser.add_argument('database', help='Status history database, e.g. status.db')
+    query_parser.add_argument('-v', '--verbose', help='Add verbose logging', action='store_true')
+    query_parser.add_argument('-w', '--where', action='append', help="Filter such as 'uploading_files>10000'. Repeat to combine")
+    query_parser.add_argument('-s', '--since', help='Only sweeps within this long, e.g. 30m, 12h, 7d')
+    query_parser.add_argument('-T', '--tenant', help='Only this Tenant')
+    query_parser.add_argument('-f', '--filer', help='Only this Filer, ordered by sweep to show its trend')
+    query_parser.add_argument('-l', '--latest', action='store_true', help='Only the latest sweep of each Filer')
+    query_parser.add_argument('-c', '--columns', help='Comma separated columns to show. Default all')
+    query_parser.add_argument('-n', '--limit', type=int, help='Maximum number of rows')
+
+    # Query perfMonitor sample archive sub parser
+    samples_help = "Print raw perfMonitor samples archived by get_status --archive."
+    samples_parser = subs.add_parser('query_samples', help=samples_help)
+    samples_parser.add_argument('directory', help='Sample archive directory')
+    samples_parser.add_argument('-v', '--verbose', help='Add verbose logging', action='store_true')
+    samples_parser.add_argument('-T', '--tenant', help='Only this Tenant')
+    samples_parser.add_argument('-f', '--filer', help='Only this Filer')
+    samples_parser.add_argument('-s', '--since', help='Only samples within this long, e.g. 30m, 12h, 7d')
+    samples_parser.add_argument('-n', '--limit', type=int, help='Maximum number of rows')
+
+    # Merge outputs sub parser
+    merge_help = "Combine get_status or run_cmd outputs, e.g. of shards, into one ordered file without duplicates."
+    merge_parser = subs.add_parser('merge', help=merge_help)
+    merge_parser.add_argument('output', help='CSV or JSONL file to write. Replaced if it exists')
+    merge_parser.add_argument('inputs', nargs='+', help='Output files to merge, oldest first')
+    merge_parser.add_argument('-v', '--verbose', help='Add verbose logging', action='store_true')
+
     # Parse arguments and run commands of chosen task
     args = parser.parse_args()
+    if args.task == 'run_cmd' and not (args.command or args.script):
+        cmd_parser.error('give a command, a --script file or both')
+    log_options = (getattr(args, 'log_format', 'text'), getattr(args, 'log_max_mb', 0), getattr(args, 'log_async', False))
     if args.verbose:
-        set_logging(logging.DEBUG, 'debug-log.txt')
+        set_logging(logging.DEBUG, 'debug-log.txt', *log_options)
     else:
-        set_logging()
+        set_logging(logging.INFO, 'info-log.txt', *log_options)
     # Uncomment to log the arguments. Will reveal a GUI password in plain text.
     # logging.debug(args)
     logging.info('Starting ctools')
+    if args.task == 'query_status':
+        columns = args.columns.split(',') if args.columns else None
+        load_task(args.task)(args.database, filters=args.where, since=args.since, tenant=args.tenant,
+                             filer=args.filer, latest=args.latest, columns=columns, limit=args.limit)
+    elif args.task == 'query_samples':
+        load_task(args.task)(args.directory, tenant=args.tenant, filer=args.filer, since=args.since,
+                             limit=args.limit)
+    elif args.task == 'merge':
+        load_task(args.task)(args.output, args.inputs)
+    if args.task in LOCAL_TASKS:
+        logging.info('Exiting ctools')
+        return
     # For CLI, if required password arg is a ?, prompt for password
     if args.password == '?':
         args.password = getpass(prompt='Password: ')
     # Create a global_admin object and login.
     # In the future, if we add device login tasks, we'll need to change this.
-    global_admin = global_admin_login(args.address, args.username, args.password, args.ignore_cert)
+    from login import global_admin_login, release_session  # pylint: disable=import-outside-toplevel
+    session_cache = SessionCache() if args.session_cache else None
+    global_admin = global_admin_login(args.address, args.username, args.password, args.ignore_cert, session_cache)
+    # Optionally start fleet tasks from the local Filer inventory cache.
+    inventory = None
+    # watch always keeps its Filer list warm in the inventory cache.
+    if args.task == 'watch' or getattr(args, 'cache_inventory', False) or getattr(args, 'refresh_inventory', False):
+        from inventory import Inventory  # pylint: disable=import-outside-toplevel
+        inventory = Inventory(args.address, args.inventory_ttl, args.refresh_inventory)
+    # Optionally skip Filers that failed in recent runs.
+    breaker = None
+    if getattr(args, 'breaker_threshold', 0):
+        from breaker import CircuitBreaker  # pylint: disable=import-outside-toplevel
+        breaker = CircuitBreaker(args.address, args.breaker_threshold, args.breaker_cooldown)
+    # Optionally narrow fleet tasks down to some Tenants and Filers.
+    selector = make_selector(args.tenants, args.devices, args.firmware, args.state) if hasattr(args, 'state') else None
+    # Optionally adapt the Filers worked on at once to how the Portal copes.
+    workers = getattr(args, 'workers', None)
+    if getattr(args, 'adaptive', False):
+        workers = AdaptiveLimit(args.min_workers, args.workers)
     # Set the chosen task.
-    selected_task = FUNCTION_MAP[args.task]
+    selected_task = load_task(args.task)
+    # Optionally time each Portal and Filer API call of the task.
+    tracing = args.timings or args.trace
+    if tracing:
+        import timing  # pylint: disable=import-outside-toplevel
+        timing.start_tracing()
     # Run selected task with required sub arguments.
     if args.task == 'get_status':
-        selected_task(global_admin, args.filename, args.all)
+        selected_task(global_admin, args.filename, args.all, workers=workers, timeout=args.timeout,
+                      fmt=args.format, compress=args.gzip or None, flush_rows=args.flush_rows,
+                      flush_bytes=args.flush_bytes, inventory=inventory, incremental=args.incremental,
+                      full_every=args.full_every, config_every=args.config_every, columns=args.columns,
+                      rollup_file=args.rollup, threshold=args.perf_threshold, archive_dir=args.archive,
+                      retries=args.retries, breaker=breaker, resume=args.resume, shard=args.shard, selector=selector)
     elif args.task == 'run_cmd':
-        selected_task(global_admin, args.command, args.all, args.device)
+        selected_task(global_admin, ([args.command] if args.command else []) + (args.commands or []), all_tenants=args.all,
+                      device_name=args.device, workers=workers, timeout=args.timeout, results_file=args.output,
+                      inventory=inventory, retries=args.retries, breaker=breaker, resume=args.resume,
+                      shard=args.shard, selector=selector, script=args.script, stop_on_error=args.stop_on_error,
+                      group=args.group, group_file=args.group_file)
+    elif args.task == 'watch':
+        selected_task(global_admin, args.all, interval=args.interval, workers=workers, timeout=args.timeout,
+                      inventory=inventory, port=args.port, bind=args.bind, filename=args.output, sweeps=args.sweeps,
+                      selector=selector)
     elif args.task == 'enable_telnet':
         selected_task(global_admin, args.device_name, args.tenant_name, args.code)
     elif args.task == 'enable_ssh':
-        selected_task(global_admin, args.device_name, args.tenant_name, args.pubkey)
-    elif args.task == 'disable_ssh':
-        selected_task(global_admin, args.device_name, args.tenant_name)
-    elif args.task == 'suspend_sync':
-        selected_task(global_admin, args.device_name, args.tenant_name)
-    elif args.task == 'unsuspend_sync':
-        selected_task(global_admin, args.device_name, args.tenant_name)
+        selected_task(global_admin, args.device_name, args.tenant_name, pubkey=args.pubkey,
+                      device_file=args.device_file, workers=workers, timeout=args.timeout, rate=args.rate,
+                      results_file=args.output, inventory=inventory, selector=selector)
+    elif args.task in ('disable_ssh', 'suspend_sync', 'unsuspend_sync'):
+        selected_task(global_admin, args.device_name, args.tenant_name, device_file=args.device_file,
+                      workers=workers, timeout=args.timeout, rate=args.rate, results_file=args.output,
+                      inventory=inventory, selector=selector)
     elif args.task == 'reset_password':
-        selected_task(global_admin, args.device_name, args.tenant_name, args.user_name, args.filer_password)
+        selected_task(global_admin, args.device_name, args.tenant_name, args.user_name, args.filer_password,
+                      device_file=args.device_file, workers=workers, timeout=args.timeout, rate=args.rate,
+                      results_file=args.output, inventory=inventory, selector=selector)
     else:
         logging.error('No task found or selected.')
-    global_admin.logout()
+    if tracing:
+        tracer = timing.stop_tracing()
+        tracer.log_summary()
+        if args.trace:
+            tracer.write_trace(args.trace)
+    if inventory:
+        inventory.close()
+    if breaker:
+        breaker.close()
+    # Keep a cached session open so the next invocation can reuse it.
+    release_session(global_admin, session_cache)
     logging.info('Exiting ctools')
 
 
+def run_gui():
+    """Import Gooey and launch the GUI. Gooey runs the chosen task with --ignore-gooey."""
+    from gooey import Gooey, GooeyParser  # pylint: disable=import-outside-toplevel
+    Gooey(**GOOEY_OPTIONS)(main)(GooeyParser)
+
+
 if __name__ == "__main__":
-    main()
+    if '--ignore-gooey' in sys.argv:
+        sys.argv.remove('--ignore-gooey')
+        main()
+    else:
+        run_gui()
@@ -0,0 +1,93 @@
+import json
+import logging
+import sqlite3
+import threading
+
+from output import to_json
+
+DEFAULT_FULL_EVERY = 24
+DEFAULT_CONFIG_EVERY = 6
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    tenant TEXT NOT NULL,
+    filer TEXT NOT NULL,
+    record TEXT NOT NULL,
+    sweeps_since_full INTEGER NOT NULL,
+    sweeps_since_config INTEGER NOT NULL,
+    PRIMARY KEY (tenant, filer)
+);
+"""
+
+
+def normalize(record):
+    """Return a record as plain JSON types, so snapshots compare by value."""
+    return json.loads(json.dumps(record, default=to_json))
+
+
+class DeltaState:
+    """
+    Previous status snapshot of each Filer, for incremental sweeps.
+
+    A Filer's config and settings are reused from its snapshot until
+    config_every sweeps have passed or its firmware changes. A full snapshot
+    is recorded every full_every sweeps. Other sweeps only record the
+    fields that changed.
+
+    Lookups happen in worker threads, so the connection is shared behind a lock.
+    """
+
+    def __init__(self, path, full_every=DEFAULT_FULL_EVERY, config_every=DEFAULT_CONFIG_EVERY):
+        self.path = path
+        self.full_every = max(1, full_every)
+        self.config_every = max(1, config_every)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        """Close the state database."""
+        with self._lock:
+            self._db.close()
+
+    def previous(self, tenant, filer):
+        """Return (record, sweeps_since_full, sweeps_since_config) for a Filer, or None."""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT record, sweeps_since_full, sweeps_since_config FROM snapshots WHERE tenant = ? AND filer = ?',
+                (tenant, filer)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1], row[2]
+
+    def reusable_config(self, tenant, filer):
+        """Return the previous record if its config and settings can be reused this sweep."""
+        previous = self.previous(tenant, filer)
+        if previous is None or previous[2] + 1 >= self.config_every:
+            return None
+        return previous[0]
+
+    def update(self, record, config_reused=False):
+        """
+        Store a Filer's new snapshot and return the record to write:
+        the whole snapshot if a full one is due, else only the changed fields.
+        Every returned record has tenant, filer and a snapshot of 'full' or 'delta'.
+        """
+        record = normalize(record)
+        previous = self.previous(record['tenant'], record['filer'])
+        since_config = previous[2] + 1 if previous and config_reused else 0
+        if previous is None or previous[1] + 1 >= self.full_every:
+            since_full = 0
+            output = dict(record, snapshot='full')
+        else:
+            since_full = previous[1] + 1
+            output = {'tenant': record['tenant'], 'filer': record['filer'], 'snapshot': 'delta'}
+            output.update((key, value) for key, value in record.items() if previous[0].get(key) != value)
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO snapshots (tenant, filer, record, sweeps_since_full, sweeps_since_config) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (record['tenant'], record['filer'], json.dumps(record), since_full, since_config))
+        if output['snapshot'] == 'delta':
+            logging.debug("%s changed fields on %s", len(output) - 3, record['filer'])
+        return output
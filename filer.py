@@ -1,36 +1,238 @@
 import logging
+import sys
+from collections import namedtuple
+from fnmatch import fnmatchcase
 from cterasdk import CTERAException
+from fleet import shard_of
+from timing import span
 
+# Cached or lightweight reference to a Filer. Use get_handle for a device object.
+# A tuple without a per-instance dict, a small fraction of the size of an SDK device object.
+# device holds the listed device object, for entries that are worked on as soon as they are listed.
+FilerEntry = namedtuple('FilerEntry', ['tenant', 'name', 'hostname', 'connected', 'device'],
+                        defaults=(None, True, None))
+# Fields listed for each Filer. Selecting by firmware also lists 'version'.
+FILER_FIELDS = ['deviceConnectionStatus.connected', 'deviceReportedStatus.config.hostname']
 
-def get_filer(self, device=None, tenant=None):
-    """Return Filer object if found"""
+
+def get_filer(self, device=None, tenant=None, include=None, quiet=False):
+    """
+    Return Filer object if found.
+    With include, also return those fields, as listed Filers have.
+    With quiet, a Filer that isn't found is only logged at debug level.
+    """
     try:
-        filer = self.devices.device(device, tenant)
-        return filer
+        with span('devices.device', device):
+            if include:
+                return self.devices.device(device, tenant, include=include)
+            return self.devices.device(device, tenant)
     except CTERAException as error:
         logging.debug(error)
-        logging.error("Device not found.")
+        if not quiet:
+            logging.error("Device not found: %s", device)
         return None
 
 
-def get_filers(self, all_tenants=False):
-    """Return all connected Filers from Admin Portal or Tenant"""
-    connected_filers = []
-    if all_tenants is True:
+def get_handle(self, filer):
+    """Return a device object for a Filer, looking up FilerEntry references that don't hold one."""
+    if isinstance(filer, FilerEntry) and filer.device is not None:
+        return filer.device
+    if isinstance(filer, FilerEntry):
+        with span('devices.device', filer.name):
+            return self.devices.device(filer.name, filer.tenant)
+    return filer
+
+
+def get_tenant(filer):
+    """Return the name of the Tenant a Filer belongs to."""
+    if isinstance(filer, FilerEntry):
+        return filer.tenant
+    return filer.session().user.tenant
+
+
+def get_hostname(filer):
+    """Return the hostname a Filer reported to the Portal, if any."""
+    try:
+        return filer.deviceReportedStatus.config.hostname
+    except AttributeError:
+        return None
+
+
+def to_entry(filer, keep_device=False):
+    """
+    Return a FilerEntry for a Filer. Tenant names are interned, so entries share them.
+    With keep_device, the entry holds the device object too.
+    """
+    if isinstance(filer, FilerEntry):
+        return filer
+    connected = getattr(getattr(filer, 'deviceConnectionStatus', None), 'connected', None)
+    return FilerEntry(sys.intern(get_tenant(filer)), filer.name, get_hostname(filer), connected,
+                      filer if keep_device else None)
+
+
+def has_glob(text):
+    """Return True if text is a glob pattern rather than a plain name."""
+    return text is not None and any(char in text for char in '*?[')
+
+
+def list_filers(self, include=None):
+    """Return all Filers in the current Tenant context, with the given fields."""
+    with span('devices.filers'):
+        return list(self.devices.filers(include=include or FILER_FIELDS))
+
+
+def list_connected_filers(self):
+    """Yield connected Filers in the current Tenant context."""
+    return (filer for filer in list_filers(self) if filer.deviceConnectionStatus.connected)
+
+
+def list_tenant_names(self):
+    """Return the names of all Tenants on the Portal."""
+    with span('portals.browse_global_admin'):
         self.portals.browse_global_admin()
+    with span('portals.tenants'):
+        return [tenant.name for tenant in self.portals.tenants()]
+
+
+def matches(filer, selector):
+    """Return True if a listed Filer matches the device names, firmware and connection state of selector."""
+    if selector.devices and not any(fnmatchcase(filer.name, pattern) for pattern in selector.devices):
+        return False
+    if isinstance(filer, FilerEntry):
+        # Cached references are only used for connected Filers, without a firmware filter.
+        return True
+    if selector.firmware and not fnmatchcase(str(getattr(filer, 'version', '')), selector.firmware):
+        return False
+    if selector.state == 'any':
+        return True
+    connected = getattr(getattr(filer, 'deviceConnectionStatus', None), 'connected', False)
+    return bool(connected) == (selector.state == 'connected')
+
+
+def select_filers(self, selector, all_tenants=False, inventory=None):
+    """
+    Yield the Filers matching selector, tenant by tenant.
+
+    Only matching Tenants are browsed, and exact Tenant names are not listed at all.
+    Exact device names in the current or exactly named Tenants are looked up one
+    by one instead of listing their Tenant. Filers are then filtered on name,
+    firmware and connection state, which the Portal device list can't filter on.
+    The Inventory cache is only used for connected Filers without a firmware
+    filter, which is all it holds. Tenants that don't exist are logged and skipped.
+    """
+    if inventory is not None and (selector.state != 'connected' or selector.firmware):
+        logging.info("Listing Filers from the Portal. The inventory only caches connected Filers.")
+        inventory = None
+    include = FILER_FIELDS + ['version'] if selector.firmware else FILER_FIELDS
+    exact = selector.devices and not any(has_glob(name) for name in selector.devices)
+    if selector.tenants is None and all_tenants is not True:
+        if exact:
+            filers = (get_filer(self, name, include=FILER_FIELDS + ['version']) for name in selector.devices)
+            yield from (filer for filer in filers if filer is not None and matches(filer, selector))
+            return
+        if inventory is not None:
+            filers = inventory.iter_filers(self)
+        else:
+            logging.info("Selecting Filers on %s", self.users.session().user.tenant)
+            filers = list_filers(self, include)
+        yield from (filer for filer in filers if matches(filer, selector))
+        return
+    names = selector.tenants
+    listed = names is None or any(has_glob(name) for name in names)
+    if listed:
+        names = inventory.tenant_names(self) if inventory is not None else list_tenant_names(self)
+        if selector.tenants is not None:
+            names = [name for name in names if any(fnmatchcase(name, pattern) for pattern in selector.tenants)]
+    logging.info("Selecting Filers on %s Tenants", len(names))
+    # Look exact names up in named Tenants. Across listed Tenants, filtering each list takes fewer calls.
+    lookup = exact and not listed
+    found = set()
+    for tenant in names:
+        if lookup:
+            for name in selector.devices:
+                filer = get_filer(self, name, tenant, FILER_FIELDS + ['version'], quiet=True)
+                if filer is not None:
+                    found.add(name)
+                    if matches(filer, selector):
+                        # The Portal didn't browse to tenant, so the device's session doesn't name it.
+                        connected = getattr(getattr(filer, 'deviceConnectionStatus', None), 'connected', None)
+                        yield FilerEntry(sys.intern(tenant), filer.name, get_hostname(filer), connected, filer)
+            continue
+        try:
+            if inventory is not None:
+                filers = inventory.tenant_filers(self, tenant)
+            else:
+                with span('portals.browse'):
+                    self.portals.browse(tenant)
+                filers = list_filers(self, include)
+        except CTERAException as error:
+            logging.debug(error)
+            logging.error("Tenant not found: %s", tenant)
+            continue
+        yield from (filer for filer in filers if matches(filer, selector))
+    for name in selector.devices if lookup else []:
+        if name not in found:
+            logging.error("Device not found: %s", name)
+
+
+def in_shard(filers, shard):
+    """Yield the filers that belong to shard, an (index, count) tuple."""
+    index, count = shard
+    for filer in filers:
+        if shard_of(get_tenant(filer), filer.name, count) == index:
+            yield filer
+
+
+def iter_filers(self, all_tenants=False, inventory=None, shard=None, selector=None, compact=False,
+                keep_devices=False):
+    """
+    Yield connected Filers from Admin Portal or Tenant, tenant by tenant,
+    as they are discovered. Callers can start work on the first Tenant's
+    Filers while later Tenants are still being browsed.
+    If an Inventory cache is given, yield cached FilerEntry references instead.
+    With shard, an (index, count) tuple, only yield the Filers in that shard.
+    With a Selector, only yield the Filers it matches. See select_filers.
+    With compact, yield FilerEntry references instead of device objects. Only
+    one Tenant's device objects are then held at a time, however many Tenants
+    there are, at the cost of a device lookup when each Filer is processed.
+    With keep_devices too, the entries hold their device objects, saving the lookup,
+    for callers that work on each Filer as it is listed. Either way, an entry's
+    Tenant is read as it is listed, before the Portal browses the next Tenant.
+    """
+    if compact:
+        filers = iter_filers(self, all_tenants, inventory, shard, selector)
+        yield from (to_entry(filer, keep_devices) for filer in filers)
+        return
+    if shard is not None:
+        yield from in_shard(iter_filers(self, all_tenants, inventory, selector=selector), shard)
+        return
+    if selector is not None:
+        yield from select_filers(self, selector, all_tenants, inventory)
+        return
+    if inventory is not None:
+        yield from inventory.iter_filers(self, all_tenants)
+        return
+    if all_tenants is True:
+        with span('portals.browse_global_admin'):
+            self.portals.browse_global_admin()
         tenant = self.users.session().user.tenant
         logging.info("Getting all Filers since tenant is %s", tenant)
-        for tenant in self.portals.tenants():
-            self.portals.browse(tenant.name)
-            all_filers = self.devices.filers(include=[
-                    'deviceConnectionStatus.connected',
-                    'deviceReportedStatus.config.hostname'])
-            connected_filers.extend([filer for filer in all_filers if filer.deviceConnectionStatus.connected])
+        with span('portals.tenants'):
+            tenants = list(self.portals.tenants())
+        for tenant in tenants:
+            with span('portals.browse'):
+                self.portals.browse(tenant.name)
+            yield from list_connected_filers(self)
     else:
         tenant = self.users.session().user.tenant
         logging.info("Getting Filers connected to %s", tenant)
-        tenant_filers = self.devices.filers(include=[
-                    'deviceConnectionStatus.connected',
-                    'deviceReportedStatus.config.hostname'])
-        connected_filers.extend([filer for filer in tenant_filers if filer.deviceConnectionStatus.connected])
-    return connected_filers
+        yield from list_connected_filers(self)
+
+
+def get_filers(self, all_tenants=False, inventory=None):
+    """
+    Return FilerEntry references for all connected Filers from Admin Portal or Tenant.
+    Device objects are only kept for one Tenant at a time while listing, so memory
+    use stays small on large Portals. Use get_handle for a Filer's device object.
+    """
+    return list(iter_filers(self, all_tenants, inventory, compact=True))
@@ -0,0 +1,325 @@
+import logging
+import queue
+import random
+import threading
+import time
+import zlib
+from collections import deque, namedtuple
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+
+DEFAULT_WORKERS = 8
+DEFAULT_TIMEOUT = 300
+DEFAULT_INVENTORY_TTL = 3600
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 1.0
+# Adaptive concurrency: back off when a window of Filers has more transient errors than this,
+# or takes this many times longer than the fastest of the last BASELINE_WINDOWS windows.
+# Durations under LATENCY_FLOOR seconds never count as slow.
+DEFAULT_MAX_ERROR_RATE = 0.05
+DEFAULT_TOLERANCE = 2.0
+LATENCY_FLOOR = 0.1
+MIN_WINDOW = 5
+BASELINE_WINDOWS = 10
+# HTTP status codes worth retrying: throttling and temporary server errors
+TRANSIENT_STATUS = {429, 500, 502, 503, 504}
+
+# state is one of 'success', 'failed', 'timeout' or 'skipped'
+FilerResult = namedtuple('FilerResult', ['filer', 'state', 'value', 'error', 'duration'])
+
+# Which Filers a fleet task works on. tenants and devices are lists of names or globs, firmware is a glob
+# and state is one of STATES. None matches any Tenant, device or firmware.
+Selector = namedtuple('Selector', ['tenants', 'devices', 'firmware', 'state'], defaults=(None, None, None, 'connected'))
+STATES = ['connected', 'disconnected', 'any']
+
+
+def is_transient(error):
+    """
+    Return True for errors worth retrying: connection errors, timeouts,
+    throttling and temporary server errors.
+    """
+    for source in (error, getattr(error, 'response', None)):
+        status = getattr(source, 'status', None) or getattr(source, 'code', None)
+        if isinstance(status, int):
+            return status in TRANSIENT_STATUS
+    return isinstance(error, OSError)
+
+
+def make_selector(tenants=None, devices=None, firmware=None, state='connected'):
+    """
+    Return a Selector from comma separated Tenant and device names or globs,
+    or None if every connected Filer is selected, as by default.
+    """
+    def split(names):
+        return [name.strip() for name in names.split(',') if name.strip()] if names else None
+
+    selector = Selector(split(tenants), split(devices), firmware or None, state or 'connected')
+    return None if selector == Selector() else selector
+
+
+def parse_shard(spec):
+    """Parse a shard spec such as '3/8' into an (index, count) tuple. Shards are numbered from 1."""
+    try:
+        index, count = (int(part) for part in spec.split('/'))
+    except ValueError as error:
+        raise ValueError(f"Invalid shard '{spec}'. Use INDEX/COUNT, e.g. 3/8") from error
+    if not 1 <= index <= count:
+        raise ValueError(f"Invalid shard '{spec}'. INDEX must be from 1 to COUNT")
+    return index, count
+
+
+def shard_of(tenant, filer, count):
+    """
+    Return the shard, from 1 to count, that a Filer belongs to.
+    Uses crc32 of tenant and Filer name, so every process and host agrees.
+    """
+    return zlib.crc32(f'{tenant}/{filer}'.encode('utf-8')) % count + 1
+
+
+class AdaptiveLimit:
+    """
+    Number of Filers to work on at once, adjusted to how well the Portal copes.
+    Pass it to a fleet task in place of a number of workers.
+
+    The limit is adjusted after each window of limit finished Filers, AIMD
+    style. Too many transient errors or timeouts, or a median duration over
+    tolerance times that of the fastest of the last BASELINE_WINDOWS windows,
+    halve the limit down to floor. Otherwise it grows by one up to ceiling.
+    As the baseline only looks back so far, a Portal that stays slower becomes
+    the new normal. Errors such as a rejected command don't count, as they
+    aren't caused by load. After halving, Filers still in flight are left out
+    of the next window. Results are recorded by the thread consuming them, so
+    no locking is needed.
+
+    :param int floor: Fewest Filers to work on at once
+    :param int ceiling: Most Filers to work on at once
+    :param int,optional start: Initial limit. Default DEFAULT_WORKERS, within floor and ceiling
+    :param float,optional tolerance: Slow down when the median duration is this many times the fastest window's
+    :param float,optional max_error_rate: Slow down when more than this fraction of a window fails transiently
+    """
+
+    def __init__(self, floor=1, ceiling=DEFAULT_WORKERS, start=None, tolerance=DEFAULT_TOLERANCE,
+                 max_error_rate=DEFAULT_MAX_ERROR_RATE):
+        self.floor = max(1, floor)
+        self.ceiling = max(self.floor, ceiling)
+        self.limit = min(self.ceiling, max(self.floor, start or DEFAULT_WORKERS))
+        self.tolerance = tolerance
+        self.max_error_rate = max_error_rate
+        self.baseline = None
+        self._latencies = deque(maxlen=BASELINE_WINDOWS)
+        self._durations = []
+        self._errors = 0
+        self._ignore = 0
+        logging.info("Adapting concurrency from %s to %s Filers at once, starting at %s",
+                     self.floor, self.ceiling, self.limit)
+
+    def record(self, duration, error=None, in_flight=0):
+        """
+        Record a finished Filer, and adjust the limit at the end of a window.
+        in_flight is how many other Filers are still running, which are left out of the next window if the limit drops.
+        """
+        if self._ignore:
+            # Started before the limit was lowered
+            self._ignore -= 1
+            return
+        self._durations.append(duration)
+        if error is not None and is_transient(error):
+            self._errors += 1
+        if len(self._durations) < max(self.limit, MIN_WINDOW):
+            return
+        latency = sorted(self._durations)[len(self._durations) // 2]
+        error_rate = self._errors / len(self._durations)
+        self._durations = []
+        self._errors = 0
+        self._latencies.append(latency)
+        self.baseline = min(self._latencies)
+        if error_rate > self.max_error_rate:
+            self._decrease(f'{error_rate:.0%} of Filers failed transiently', in_flight)
+        elif latency > max(self.baseline * self.tolerance, LATENCY_FLOOR):
+            self._decrease(f'median duration {latency:.2f}s is over {self.tolerance:g}x the recent fastest '
+                           f'{self.baseline:.2f}s', in_flight)
+        elif self.limit < self.ceiling:
+            self.limit += 1
+            logging.info("Raising concurrency to %s. Median duration %.2fs, %.0f%% transient errors",
+                         self.limit, latency, error_rate * 100)
+
+    def _decrease(self, reason, in_flight):
+        limit = max(self.floor, self.limit // 2)
+        if limit < self.limit:
+            logging.warning("Lowering concurrency from %s to %s: %s", self.limit, limit, reason)
+        else:
+            logging.info("Keeping concurrency at its floor of %s: %s", limit, reason)
+        self._ignore = in_flight
+        self.limit = limit
+
+
+def call_with_retries(func, filer, retries=0, backoff=DEFAULT_BACKOFF, timeout=None, start=None):
+    """
+    Run func on filer. Transient errors are retried up to retries times, with
+    exponential backoff and jitter, as long as the retry can start within
+    timeout seconds of start, by default now.
+    """
+    start = time.monotonic() if start is None else start
+    for attempt in range(retries + 1):
+        try:
+            return func(filer)
+        except Exception as error:  # pylint: disable=broad-except
+            delay = backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+            elapsed = time.monotonic() - start
+            if attempt >= retries or not is_transient(error) or (timeout and elapsed + delay >= timeout):
+                raise
+            logging.debug("Retrying %s in %.1fs after: %s", getattr(filer, 'name', filer), delay, error)
+            time.sleep(delay)
+    return None
+
+
+class DaemonThreadPool:
+    """
+    Thread pool like concurrent.futures.ThreadPoolExecutor, on daemon threads.
+    ThreadPoolExecutor joins its threads at interpreter exit, so a Filer call
+    abandoned after a timeout would keep the process alive until it returns.
+    Threads are started as jobs come in, up to max_workers.
+    """
+
+    def __init__(self, max_workers, thread_name_prefix='filer'):
+        self._max_workers = max_workers
+        self._prefix = thread_name_prefix
+        self._jobs = queue.SimpleQueue()
+        self._idle = threading.Semaphore(0)
+        self._threads = 0
+
+    def submit(self, func, *args):
+        """Schedule func(*args) and return a Future for its result."""
+        future = Future()
+        self._jobs.put((future, func, args))
+        if not self._idle.acquire(blocking=False) and self._threads < self._max_workers:
+            threading.Thread(target=self._work, name=f'{self._prefix}_{self._threads}', daemon=True).start()
+            self._threads += 1
+        return future
+
+    def shutdown(self, cancel_futures=False):
+        """Let the threads exit once their current job is done. With cancel_futures, cancel jobs not started yet."""
+        while cancel_futures:
+            try:
+                self._jobs.get_nowait()[0].cancel()
+            except queue.Empty:
+                break
+        for _ in range(self._threads):
+            self._jobs.put(None)
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            future, func, args = job
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(func(*args))
+                except BaseException as error:  # pylint: disable=broad-except
+                    future.set_exception(error)
+            self._idle.release()
+
+
+def _timed_call(func, filer, clock, retries=0, backoff=DEFAULT_BACKOFF, timeout=None):
+    """Record the start time in clock, then run func on filer with call_with_retries."""
+    clock.append(time.monotonic())
+    return call_with_retries(func, filer, retries, backoff, timeout, clock[0])
+
+
+def run_concurrently(func, filers, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, spacing=0,
+                     retries=0, backoff=DEFAULT_BACKOFF, skip=None):
+    """
+    Run func(filer) for each filer in a thread pool and yield a FilerResult
+    for each one as it finishes. Results are yielded in the calling thread,
+    so the caller can write them out without any locking.
+
+    Filers are consumed lazily, keeping at most workers jobs in flight.
+    A filer still running after timeout seconds is reported as 'timeout' and
+    abandoned. Its thread can't be killed, so it is left running until the
+    underlying request returns, and later filers start on a new thread pool.
+    Threads are daemon threads, so abandoned calls don't keep the process alive.
+
+    With spacing, jobs start at least that many seconds apart, spreading the
+    load instead of starting a burst of workers requests at once.
+
+    Transient errors are retried within the filer's timeout. If skip returns
+    a reason for a filer, it isn't run and is reported as 'skipped'.
+
+    workers can be an AdaptiveLimit, which is told how each filer went and
+    sets how many jobs may be in flight from then on.
+
+    :param func: Callable taking a single filer
+    :param filers: Iterable of filers
+    :param int,optional workers: Number of filers to process at once, or an AdaptiveLimit
+    :param int,optional timeout: Seconds allowed per filer. 0 or None to disable.
+    :param float,optional spacing: Minimum seconds between job starts
+    :param int,optional retries: Retries of transient errors per filer
+    :param float,optional backoff: Seconds before the first retry, doubled for each one after
+    :param skip: Optional callable taking a filer, returning a reason to skip it or None
+    """
+    limiter = workers if isinstance(workers, AdaptiveLimit) else None
+    workers = limiter.ceiling if limiter else max(1, workers or 1)
+    pool_size = workers
+    filers = iter(filers)
+    pending = {}
+    executor = DaemonThreadPool(pool_size)
+    try:
+        exhausted = False
+        next_start = time.monotonic()
+        while pending or not exhausted:
+            if limiter:
+                workers = limiter.limit
+            while not exhausted and len(pending) < workers and time.monotonic() >= next_start:
+                try:
+                    filer = next(filers)
+                except StopIteration:
+                    exhausted = True
+                    break
+                reason = skip(filer) if skip else None
+                if reason:
+                    yield FilerResult(filer, 'skipped', None, reason, 0.0)
+                    continue
+                clock = []
+                future = executor.submit(_timed_call, func, filer, clock, retries, backoff, timeout)
+                pending[future] = (filer, clock)
+                if spacing:
+                    next_start = time.monotonic() + spacing
+            # Wake up for the next timeout check or the next spaced start, whichever comes first.
+            waits = [1] if timeout else []
+            if not exhausted and len(pending) < workers:
+                waits.append(max(0, next_start - time.monotonic()))
+            if not pending:
+                if exhausted:
+                    break
+                time.sleep(min(waits))
+                continue
+            done, _ = wait(pending, timeout=min(waits) if waits else None, return_when=FIRST_COMPLETED)
+            now = time.monotonic()
+            for future in done:
+                filer, clock = pending.pop(future)
+                duration = now - clock[0] if clock else 0.0
+                error = future.exception()
+                if limiter:
+                    limiter.record(duration, error, len(pending))
+                if error is None:
+                    yield FilerResult(filer, 'success', future.result(), None, duration)
+                else:
+                    yield FilerResult(filer, 'failed', None, error, duration)
+            if not timeout:
+                continue
+            expired = [(future, filer, now - clock[0]) for future, (filer, clock) in pending.items()
+                       if clock and now - clock[0] > timeout]
+            if expired:
+                # The threads of timed out jobs stay busy. Leave them to the old pool, which still
+                # runs its other jobs, and start new jobs on a fresh one so hung Filers can't stall the rest.
+                executor.shutdown()
+                executor = DaemonThreadPool(pool_size)
+            for future, filer, duration in expired:
+                del pending[future]
+                logging.warning("Timed out after %ss on %s", timeout, getattr(filer, 'name', filer))
+                error = TimeoutError(f'Timed out after {timeout}s')
+                if limiter:
+                    limiter.record(duration, error, len(pending))
+                yield FilerResult(filer, 'timeout', None, error, duration)
+    finally:
+        executor.shutdown(cancel_futures=True)
@@ -0,0 +1,227 @@
+import csv
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import time
+
+from output import to_json, DEFAULT_FLUSH_ROWS
+
+# Typed columns of the status table, in status record order.
+COLUMNS = [('tenant', 'TEXT NOT NULL'),
+           ('filer', 'TEXT NOT NULL'),
+           ('sync_status', 'TEXT'),
+           ('self_scan_interval_hours', 'INTEGER'),
+           ('uploading_files', 'INTEGER'),
+           ('scanning_files', 'INTEGER'),
+           ('self_verification_scanning_files', 'INTEGER'),
+           ('metalogs_setting', 'TEXT'),
+           ('metalog_max_size', 'INTEGER'),
+           ('metalog_max_files', 'INTEGER'),
+           ('firmware', 'TEXT'),
+           ('license', 'TEXT'),
+           ('eviction_percentage', 'INTEGER'),
+           ('volume_total', 'INTEGER'),
+           ('volume_used', 'INTEGER'),
+           ('volume_free', 'INTEGER'),
+           ('ip', 'TEXT'),
+           ('dns1', 'TEXT'),
+           ('dns2', 'TEXT'),
+           ('ad_status', 'TEXT'),
+           ('alerts', 'TEXT'),
+           ('ntp_mode', 'TEXT'),
+           ('time_zone', 'TEXT'),
+           ('ntp_servers', 'TEXT'),
+           ('uptime', 'TEXT'),
+           ('cpu', 'REAL'),
+           ('memory', 'REAL'),
+           ('max_cpu', 'REAL'),
+           ('max_memory', 'REAL'),
+           ('cpu_mean', 'REAL'),
+           ('cpu_p50', 'REAL'),
+           ('cpu_p95', 'REAL'),
+           ('cpu_above', 'REAL'),
+           ('memory_mean', 'REAL'),
+           ('memory_p50', 'REAL'),
+           ('memory_p95', 'REAL'),
+           ('memory_above', 'REAL'),
+           ('error', 'TEXT'),
+           ]
+COLUMN_NAMES = ['sweep'] + [name for name, _ in COLUMNS]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS status (
+    sweep INTEGER NOT NULL,
+    %s,
+    PRIMARY KEY (sweep, tenant, filer)
+);
+CREATE INDEX IF NOT EXISTS idx_status_filer ON status (filer, sweep);
+CREATE INDEX IF NOT EXISTS idx_status_tenant ON status (tenant, sweep);
+""" % ',\n    '.join(f'{name} {sql_type}' for name, sql_type in COLUMNS)
+
+OPERATORS = ['>=', '<=', '!=', '=', '>', '<']
+FILTER_PATTERN = re.compile(r'^\s*(\w+)\s*(%s)\s*(.+?)\s*$' % '|'.join(re.escape(op) for op in OPERATORS))
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def to_column(value, sql_type):
+    """Convert a status record value to a value for a typed column."""
+    if value is None:
+        return None
+    if sql_type.startswith('INTEGER') or sql_type.startswith('REAL'):
+        try:
+            return int(value) if sql_type.startswith('INTEGER') else float(value)
+        except (TypeError, ValueError):
+            return str(value)
+    if isinstance(value, (str, int, float)):
+        return value
+    return json.dumps(value, default=to_json)
+
+
+class HistoryWriter:
+    """
+    Write status records from one sweep into an indexed SQLite database.
+    Each row is keyed by the sweep timestamp, Tenant and Filer.
+    """
+
+    fmt = 'sqlite'
+
+    def __init__(self, path, flush_rows=DEFAULT_FLUSH_ROWS, sweep=None):
+        self.path = path
+        self.sweep = int(sweep if sweep is not None else time.time())
+        self.flush_rows = max(1, flush_rows)
+        self.rows = 0
+        self._buffer = []
+        self._db = sqlite3.connect(path)
+        self._db.executescript(SCHEMA)
+        self._add_missing_columns()
+        logging.info("Recording sweep %s in %s", self.sweep, path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _add_missing_columns(self):
+        """Add columns introduced since the database was created."""
+        existing = {row[1] for row in self._db.execute('PRAGMA table_info(status)')}
+        with self._db:
+            for name, sql_type in COLUMNS:
+                if name not in existing:
+                    self._db.execute(f'ALTER TABLE status ADD COLUMN {name} {sql_type}')
+
+    def write(self, record):
+        """Buffer a status record, inserting buffered records once flush_rows are pending."""
+        self._buffer.append([self.sweep] + [to_column(record.get(name), sql_type) for name, sql_type in COLUMNS])
+        self.rows += 1
+        if len(self._buffer) >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        """Insert buffered records in a single transaction."""
+        if self._buffer:
+            with self._db:
+                self._db.executemany(
+                    'INSERT OR REPLACE INTO status (%s) VALUES (%s)' % (
+                        ', '.join(COLUMN_NAMES), ', '.join('?' * len(COLUMN_NAMES))),
+                    self._buffer)
+            self._buffer = []
+
+    def close(self):
+        """Insert any buffered records and close the database."""
+        self.flush()
+        self._db.close()
+
+
+def parse_filter(expression):
+    """
+    Parse a filter such as 'uploading_files>10000' into SQL and a parameter.
+    Only known column names and comparison operators are accepted.
+    """
+    match = FILTER_PATTERN.match(expression)
+    if not match or match.group(1) not in COLUMN_NAMES:
+        raise ValueError(f"Invalid filter '{expression}'. Use <column><operator><value>, "
+                         f"with one of {', '.join(OPERATORS)}")
+    name, operator, value = match.groups()
+    try:
+        value = float(value) if '.' in value else int(value)
+    except ValueError:
+        value = value.strip('\'"')
+    return f'{name} {operator} ?', value
+
+
+def parse_duration(text):
+    """Return seconds for a duration such as '30m', '12h' or '7d'."""
+    match = re.fullmatch(r'(\d+)([smhdw]?)', text.strip())
+    if not match:
+        raise ValueError(f"Invalid duration '{text}'. Use a number followed by s, m, h, d or w")
+    return int(match.group(1)) * DURATION_UNITS[match.group(2) or 's']
+
+
+def query_status(database, filters=None, since=None, tenant=None, filer=None, latest=False, columns=None, limit=None):
+    """
+    Query status history and print matching rows as CSV.
+
+    :param str database: SQLite status history file
+    :param list[str],optional filters: Filters such as 'uploading_files>10000'
+    :param str,optional since: Only include sweeps within this duration, e.g. '7d'
+    :param str,optional tenant: Only include this Tenant
+    :param str,optional filer: Only include this Filer, ordered by sweep for a trend
+    :param bool,optional latest: Only include the latest sweep of each Filer
+    :param list[str],optional columns: Columns to print. Default all
+    :param int,optional limit: Maximum number of rows
+    """
+    logging.info('Starting query_status task.')
+    if not os.path.exists(database):
+        logging.error("Status history not found: %s", database)
+        sys.exit("Make sure you entered a valid file name and it exists")
+    columns = columns or COLUMN_NAMES
+    unknown = [name for name in columns if name not in COLUMN_NAMES]
+    try:
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+        conditions, params = [], []
+        for expression in filters or []:
+            condition, value = parse_filter(expression)
+            conditions.append(condition)
+            params.append(value)
+        if since:
+            conditions.append('sweep >= ?')
+            params.append(int(time.time()) - parse_duration(since))
+    except ValueError as error:
+        logging.error(error)
+        sys.exit("Invalid query_status arguments.")
+    if tenant:
+        conditions.append('tenant = ?')
+        params.append(tenant)
+    if filer:
+        conditions.append('filer = ?')
+        params.append(filer)
+    table = 'status'
+    if latest:
+        # Latest row per Filer
+        table = ('(SELECT s.* FROM status s JOIN '
+                 '(SELECT tenant AS t, filer AS f, MAX(sweep) AS m FROM status GROUP BY tenant, filer) l '
+                 'ON s.tenant = l.t AND s.filer = l.f AND s.sweep = l.m)')
+    sql = f"SELECT {', '.join(columns)} FROM {table}"
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY tenant, filer, sweep' if filer else ' ORDER BY sweep, tenant, filer'
+    if limit:
+        sql += f' LIMIT {int(limit)}'
+    logging.debug(sql)
+    db = sqlite3.connect(database)
+    try:
+        rows = db.execute(sql, params)
+        writer = csv.writer(sys.stdout)
+        writer.writerow(columns)
+        count = 0
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    finally:
+        db.close()
+    logging.info("Finished query_status task. %s rows.", count)
@@ -0,0 +1,128 @@
+import logging
+import os
+import sqlite3
+import time
+
+from filer import FilerEntry, get_hostname, list_connected_filers
+from fleet import DEFAULT_INVENTORY_TTL
+from timing import span
+
+DEFAULT_DB = os.path.join(os.path.expanduser('~'), '.ctools', 'inventory.db')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tenants (
+    portal TEXT NOT NULL,
+    tenant TEXT NOT NULL,
+    refreshed REAL NOT NULL,
+    PRIMARY KEY (portal, tenant)
+);
+CREATE TABLE IF NOT EXISTS filers (
+    portal TEXT NOT NULL,
+    tenant TEXT NOT NULL,
+    name TEXT NOT NULL,
+    hostname TEXT,
+    PRIMARY KEY (portal, tenant, name)
+);
+CREATE TABLE IF NOT EXISTS tenant_lists (
+    portal TEXT PRIMARY KEY,
+    refreshed REAL NOT NULL
+);
+"""
+
+
+class Inventory:
+    """
+    Local SQLite cache of connected Filers, keyed by Portal address.
+
+    Each Tenant's Filer list is cached separately, so only Tenants whose
+    entry is older than ttl seconds are listed again from the Portal.
+    """
+
+    def __init__(self, address, ttl=DEFAULT_INVENTORY_TTL, refresh=False, path=DEFAULT_DB):
+        self.address = address
+        self.ttl = ttl
+        self.refresh = refresh
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        """Close the database connection."""
+        self._db.close()
+
+    def _is_fresh(self, refreshed):
+        return not self.refresh and refreshed is not None and time.time() - refreshed < self.ttl
+
+    def _tenant_refreshed(self, tenant):
+        row = self._db.execute('SELECT refreshed FROM tenants WHERE portal = ? AND tenant = ?',
+                               (self.address, tenant)).fetchone()
+        return row[0] if row else None
+
+    def tenant_names(self, portal):
+        """Return Tenant names, listing them from the Portal if the cached list expired."""
+        row = self._db.execute('SELECT refreshed FROM tenant_lists WHERE portal = ?', (self.address,)).fetchone()
+        if row and self._is_fresh(row[0]):
+            return [name for (name,) in self._db.execute(
+                'SELECT tenant FROM tenants WHERE portal = ? ORDER BY rowid', (self.address,))]
+        logging.info("Refreshing Tenant list for %s", self.address)
+        with span('portals.browse_global_admin'):
+            portal.portals.browse_global_admin()
+        with span('portals.tenants'):
+            names = [tenant.name for tenant in portal.portals.tenants()]
+        with self._db:
+            self._db.execute(
+                'DELETE FROM filers WHERE portal = ? AND tenant NOT IN (%s)' % ','.join('?' * len(names)),
+                (self.address, *names))
+            self._db.execute(
+                'DELETE FROM tenants WHERE portal = ? AND tenant NOT IN (%s)' % ','.join('?' * len(names)),
+                (self.address, *names))
+            self._db.executemany(
+                'INSERT OR IGNORE INTO tenants (portal, tenant, refreshed) VALUES (?, ?, 0)',
+                [(self.address, name) for name in names])
+            self._db.execute('INSERT OR REPLACE INTO tenant_lists (portal, refreshed) VALUES (?, ?)',
+                             (self.address, time.time()))
+        return names
+
+    def _store_tenant(self, tenant, filers):
+        with self._db:
+            self._db.execute('DELETE FROM filers WHERE portal = ? AND tenant = ?', (self.address, tenant))
+            self._db.executemany(
+                'INSERT OR REPLACE INTO filers (portal, tenant, name, hostname) VALUES (?, ?, ?, ?)',
+                [(self.address, tenant, filer.name, get_hostname(filer)) for filer in filers])
+            self._db.execute('INSERT OR REPLACE INTO tenants (portal, tenant, refreshed) VALUES (?, ?, ?)',
+                             (self.address, tenant, time.time()))
+
+    def _cached_tenant(self, tenant):
+        # Entries share the one tenant string.
+        return [FilerEntry(tenant, name, hostname) for name, hostname in self._db.execute(
+            'SELECT name, hostname FROM filers WHERE portal = ? AND tenant = ? ORDER BY name',
+            (self.address, tenant))]
+
+    def tenant_filers(self, portal, tenant, browse=True):
+        """
+        Return cached FilerEntry references for a Tenant.
+        If the cache entry expired, list connected Filers from the Portal first.
+        """
+        if self._is_fresh(self._tenant_refreshed(tenant)):
+            logging.debug("Using cached Filers for %s", tenant)
+        else:
+            logging.info("Refreshing cached Filers for %s", tenant)
+            if browse:
+                with span('portals.browse'):
+                    portal.portals.browse(tenant)
+            self._store_tenant(tenant, list_connected_filers(portal))
+        return self._cached_tenant(tenant)
+
+    def iter_filers(self, portal, all_tenants=False):
+        """Yield FilerEntry references for connected Filers from the cache, tenant by tenant."""
+        if all_tenants is not True:
+            tenant = portal.users.session().user.tenant
+            logging.info("Getting cached Filers connected to %s", tenant)
+            yield from self.tenant_filers(portal, tenant, browse=False)
+            return
+        logging.info("Getting all cached Filers for %s", self.address)
+        for tenant in self.tenant_names(portal):
+            yield from self.tenant_filers(portal, tenant)
@@ -1,5 +1,6 @@
 import logging
 import sys
+import time
 from io import StringIO
 import urllib3
 
@@ -14,13 +15,15 @@ def check_allow_device_sso(self):
     read-write admins of the current tenant. If not, log a warning.
 
     :param self: GlobalAdmin instance
+    :returns: True if Single Sign On to Devices is allowed
     """
     device_sso = self.get('rolesSettings/readWriteAdminSettings/allowSSO')
     if device_sso is True:
         logging.debug('Single Sign On to Devices is allowed.')
-    else:
-        logging.warning("Allow Single Sign On to Devices is not enabled.")
-        logging.warning("Some tasks may fail or output may be incomplete.")
+        return True
+    logging.warning("Allow Single Sign On to Devices is not enabled.")
+    logging.warning("Some tasks may fail or output may be incomplete.")
+    return False
 
 
 def handle_exceptions(address: str, error):
@@ -44,27 +47,77 @@ def handle_exceptions(address: str, error):
         sys.exit("Exiting ctools.")
 
 
-def global_admin_login(address: str, username: str, password: str, ignore_cert=False):
+def resume_session(address: str, username: str, session_cache):
+    """
+    Return a GlobalAdmin object using a cached session, or None if there is
+    no cached session or the Portal no longer accepts it.
+
+    :param str address: Portal IP, hostname, or FQDN
+    :param str username: User name the session belongs to
+    :param SessionCache session_cache: Cache of session IDs
+    """
+    entry = session_cache.get(address, username)
+    if not entry:
+        return None
+    try:
+        global_admin = GlobalAdmin(address)
+        global_admin.set_session_id(entry['session_id'])
+        global_admin.get('/currentSession')  # Fails if the Portal expired the session
+        # The Portal keeps the session's browsed Tenant. Start from the Global Admin, as a new login does.
+        global_admin.portals.browse_global_admin()
+        logging.info("Resumed cached session on %s", address)
+        return global_admin
+    except CTERAException as error:
+        logging.debug(error)
+        logging.info("Cached session expired. Logging in again.")
+        session_cache.remove(address, username)
+        return None
+
+
+def release_session(global_admin, session_cache=None):
+    """
+    Log out, or with a session cache, browse back to the Global Admin so
+    the cached session doesn't keep the last browsed Tenant.
+    """
+    try:
+        if session_cache is None:
+            global_admin.logout()
+        else:
+            global_admin.portals.browse_global_admin()
+    except CTERAException as error:
+        logging.debug(error)
+
+
+def global_admin_login(address: str, username: str, password: str, ignore_cert=False, session_cache=None):
     """
     Log into provided portal address and return GlobalAdmin object.
     If prompted to proceed with insecure connection, answer no.
     If --ignore_cert is set, then trust the cert and disable warnings.
+    If a session cache is given, reuse a valid cached session and save new ones.
 
     :param str address: Portal IP, hostname, or FQDN
     :param str username: User name to log in as
     :param str password: User password
     :param bool,optional ignore_cert: Ignore and disable certificate warnings
+    :param SessionCache,optional session_cache: Cache of session IDs
     """
     if ignore_cert is True:
         cterasdk_config.http['ssl'] = 'Trust'
         urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
     sys.stdin = StringIO('n')  # if prompted, answer no
     try:
-        logging.info("Logging into %s", address)
-        global_admin = GlobalAdmin(address)
-        global_admin.login(username, password)
-        logging.debug("Successfully logged in to %s", address)
-        check_allow_device_sso(global_admin)
+        global_admin = resume_session(address, username, session_cache) if session_cache else None
+        if global_admin is None:
+            logging.info("Logging into %s", address)
+            global_admin = GlobalAdmin(address)
+            global_admin.login(username, password)
+            logging.debug("Successfully logged in to %s", address)
+            if session_cache:
+                session_cache.save(address, username, global_admin.get_session_id())
+        if session_cache and session_cache.sso_recently_checked(address, username):
+            logging.debug('Single Sign On to Devices was recently verified.')
+        elif check_allow_device_sso(global_admin) and session_cache:
+            session_cache.save(address, username, global_admin.get_session_id(), time.time())
         return global_admin
     except CTERAException as error:
         handle_exceptions(address, error)
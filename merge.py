@@ -0,0 +1,87 @@
+import csv
+import gzip
+import json
+import logging
+import os
+import sys
+
+from output import RecordWriter, guess_format
+
+
+def open_input(filename):
+    """Open a CSV or JSONL output file for reading, gzipped or not."""
+    if filename.endswith('.gz'):
+        return gzip.open(filename, mode='rt', newline='', encoding='utf-8-sig')
+    return open(filename, mode='r', newline='', encoding='utf-8-sig')
+
+
+def read_records(filename, fmt):
+    """
+    Yield a ((tenant, filer, command), record) pair for each row of a CSV or JSONL output file.
+    command is None except in run_cmd results of several commands.
+    A CSV file yields its header first, with a None key.
+    """
+    with open_input(filename) as input_file:
+        if fmt == 'csv':
+            reader = csv.reader(input_file)
+            header = next(reader, None)
+            yield None, header
+            command = header.index('Command') if header and 'Command' in header else None
+            for row in reader:
+                if len(row) >= 2:
+                    yield (row[0], row[1], row[command] if command is not None else None), row
+            return
+        for line in input_file:
+            if line.strip():
+                record = json.loads(line)
+                yield (record.get('tenant'), record.get('filer'), record.get('command')), record
+
+
+def merge_outputs(filename, inputs):
+    """
+    Combine get_status or run_cmd outputs, e.g. of sharded sweeps, into one file.
+    Rows are ordered by Tenant and Filer. A Filer found more than once keeps its
+    last row, or its last row per command for run_cmd batches, so list inputs
+    oldest first. An existing output file is replaced.
+
+    :param str filename: CSV or JSONL file to write, .gz to compress
+    :param list[str] inputs: CSV or JSONL files to merge, in the same format as filename
+    """
+    logging.info('Starting merge task.')
+    fmt = guess_format(filename)
+    try:
+        if fmt == 'sqlite':
+            raise ValueError('Merge CSV or JSONL outputs. sqlite history can be queried with query_status')
+        for name in inputs:
+            if not os.path.exists(name):
+                raise ValueError(f'Input not found: {name}')
+            if guess_format(name) != fmt:
+                raise ValueError(f'{name} is not in the {fmt} format of {filename}')
+            if os.path.exists(filename) and os.path.samefile(name, filename):
+                raise ValueError(f'Output {filename} is also an input')
+    except ValueError as error:
+        logging.error(error)
+        sys.exit("Invalid merge arguments.")
+    header = None
+    records = {}
+    rows = 0
+    for name in inputs:
+        for key, record in read_records(name, fmt):
+            if key is None:
+                if header is not None and record != header:
+                    logging.error("%s has different columns than %s", name, inputs[0])
+                    sys.exit("Merge outputs with the same columns.")
+                header = record
+                continue
+            records[key] = record
+            rows += 1
+    temporary = filename + '.tmp'
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    with RecordWriter(temporary, fmt, header=header, compress=filename.endswith('.gz')) as writer:
+        # A stable sort keeps each Filer's commands in the order they ran.
+        for key in sorted(records, key=lambda key: (str(key[0]).lower(), str(key[1]).lower(), str(key[0]), str(key[1]))):
+            writer.write(records[key])
+    os.replace(temporary, filename)
+    logging.info("Merged %s rows from %s files into %s rows in %s. Dropped %s duplicates.",
+                 rows, len(inputs), len(records), filename, rows - len(records))
@@ -0,0 +1,122 @@
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+
+FORMATS = ['csv', 'jsonl', 'sqlite']
+DEFAULT_FLUSH_ROWS = 100
+DEFAULT_FLUSH_BYTES = 1024 * 1024
+
+
+def guess_format(filename):
+    """Return the output format implied by a filename's extension."""
+    name = filename[:-3] if filename.endswith('.gz') else filename
+    if name.endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    if name.endswith(('.db', '.sqlite', '.sqlite3')):
+        return 'sqlite'
+    return 'csv'
+
+
+def to_json(value):
+    """Convert SDK objects and other non-JSON types for json.dumps."""
+    try:
+        return vars(value)
+    except TypeError:
+        return str(value)
+
+
+def read_header(filename, compress=None):
+    """Return the header row of an existing CSV file, gzipped or not."""
+    if compress is None:
+        compress = filename.endswith('.gz')
+    opener = gzip.open if compress else open
+    with opener(filename, mode='rt', newline='', encoding='utf-8-sig') as csv_file:
+        return next(csv.reader(csv_file), [])
+
+
+class RecordWriter:
+    """
+    Stream records to a single open file handle.
+
+    Rows are formatted as they are written and buffered in memory,
+    then flushed once flush_rows rows or flush_bytes bytes are pending.
+    CSV output takes a list per row. JSONL output takes a dict per row and
+    keeps numbers as numbers. A .gz filename or compress=True adds gzip.
+    Appending to a CSV file with a different header raises ValueError.
+    """
+
+    def __init__(self, filename, fmt=None, header=None, compress=None,
+                 flush_rows=DEFAULT_FLUSH_ROWS, flush_bytes=DEFAULT_FLUSH_BYTES):
+        self.filename = filename
+        self.fmt = fmt or guess_format(filename)
+        if compress is None:
+            compress = filename.endswith('.gz')
+        self.flush_rows = max(1, flush_rows)
+        self.flush_bytes = max(1, flush_bytes)
+        self._buffer = []
+        self._buffered_bytes = 0
+        self.rows = 0
+        is_new = not os.path.exists(filename) or os.path.getsize(filename) == 0
+        if not is_new and header and self.fmt == 'csv':
+            existing = read_header(filename, compress)
+            if existing != [str(name) for name in header]:
+                raise ValueError(f"{filename} has other columns than this run. Use a new file or the same columns")
+        # Only start new CSV files with a BOM. Appending to a gzip file adds a new member,
+        # which would otherwise get a BOM of its own.
+        encoding = 'utf-8-sig' if self.fmt == 'csv' and is_new else 'utf-8'
+        if compress:
+            self._file = gzip.open(filename, mode='at', newline='', encoding=encoding)
+        else:
+            self._file = open(filename, mode='a', newline='', encoding=encoding)
+        if is_new and header and self.fmt == 'csv':
+            self._append(self._format_csv(header))
+            self.flush()
+        elif not is_new:
+            logging.info('Appending to existing file.')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _format_csv(row):
+        line = io.StringIO()
+        csv.writer(line,
+                   dialect='excel',
+                   delimiter=',',
+                   quotechar='"',
+                   quoting=csv.QUOTE_MINIMAL).writerow(row)
+        return line.getvalue()
+
+    def _append(self, text):
+        self._buffer.append(text)
+        self._buffered_bytes += len(text)
+
+    def write(self, row):
+        """Format and buffer a single row, flushing if a limit is reached."""
+        if self.fmt == 'jsonl':
+            self._append(json.dumps(row, default=to_json) + '\n')
+        else:
+            self._append(self._format_csv(row))
+        self.rows += 1
+        if len(self._buffer) >= self.flush_rows or self._buffered_bytes >= self.flush_bytes:
+            self.flush()
+
+    def flush(self):
+        """Write buffered rows to the file."""
+        if self._buffer:
+            self._file.write(''.join(self._buffer))
+            self._buffer = []
+            self._buffered_bytes = 0
+        self._file.flush()
+
+    def close(self):
+        """Flush any buffered rows and close the file."""
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
@@ -0,0 +1,113 @@
+import json
+import logging
+import math
+from array import array
+from collections import defaultdict
+
+# Percent usage above which a sample counts toward time above threshold.
+# Set before a sweep, like cterasdk's config.http settings.
+config = {'threshold': 80.0}
+
+METRICS = [('cpu', 'cpu'), ('memory', 'memUsage')]
+STATS = ['max', 'mean', 'p50', 'p95', 'above']
+
+
+def percentile(ordered, percent):
+    """Return the nearest-rank percentile of an ordered sequence."""
+    rank = max(0, min(len(ordered) - 1, math.ceil(percent * len(ordered) / 100) - 1))
+    return ordered[rank]
+
+
+def summarize(values, threshold):
+    """
+    Return max, mean, p50, p95 and the percent of samples above threshold
+    for a list of usage values.
+    """
+    if not values:
+        return dict.fromkeys(STATS)
+    ordered = sorted(values)
+    count = len(ordered)
+    above = count - next((i for i, value in enumerate(ordered) if value > threshold), count)
+    return {'max': ordered[-1],
+            'mean': round(sum(ordered) / count, 2),
+            'p50': percentile(ordered, 50),
+            'p95': percentile(ordered, 95),
+            'above': round(100 * above / count, 2)}
+
+
+def sample_stats(filer, info):  # pylint: disable=unused-argument
+    """
+    Return a dict of statistics of a Filer's perfMonitor samples,
+    keyed like cpu_max, cpu_p95 or memory_above.
+    """
+    samples = info.proc.perfMonitor.samples
+    stats = {}
+    for metric, name in METRICS:
+        values = [getattr(sample, name) for sample in samples]
+        for stat, value in summarize(values, config['threshold']).items():
+            stats[f'{metric}_{stat}'] = value
+    return stats
+
+
+class Rollup:
+    """
+    Collect per-Filer performance statistics during a sweep and report
+    Tenant and fleet level rollups and the hottest Filers at the end.
+    Only the numbers needed for the rollup are kept per Filer.
+    """
+
+    def __init__(self):
+        self._names = []
+        self._values = {f'{metric}_{stat}': array('d') for metric, _ in METRICS for stat in ('mean', 'p95', 'above')}
+
+    def add(self, record):
+        """Add a record with statistics fields. Records without them are ignored."""
+        if any(record.get(key) is None for key in self._values):
+            return
+        self._names.append((record['tenant'], record['filer']))
+        for key, values in self._values.items():
+            values.append(record[key])
+
+    @staticmethod
+    def _aggregate(indexes, values):
+        return {key: {'mean': round(sum(values[key][i] for i in indexes) / len(indexes), 2),
+                      'max': max(values[key][i] for i in indexes)}
+                for key in values}
+
+    def report(self, top=10):
+        """Return fleet and per-Tenant rollups and the top Filers by CPU and memory p95."""
+        if not self._names:
+            return {'filers': 0}
+        everyone = range(len(self._names))
+        tenants = defaultdict(list)
+        for index, (tenant, _) in enumerate(self._names):
+            tenants[tenant].append(index)
+
+        def hottest(key):
+            ranked = sorted(everyone, key=lambda i: self._values[key][i], reverse=True)[:top]
+            return [{'tenant': self._names[i][0], 'filer': self._names[i][1], key: self._values[key][i]} for i in ranked]
+
+        return {'filers': len(self._names),
+                'threshold': config['threshold'],
+                'fleet': self._aggregate(everyone, self._values),
+                'tenants': {tenant: dict(self._aggregate(indexes, self._values), filers=len(indexes))
+                            for tenant, indexes in tenants.items()},
+                'hottest_cpu': hottest('cpu_p95'),
+                'hottest_memory': hottest('memory_p95')}
+
+    def log(self, top=10, filename=None):
+        """Log the fleet rollup and hottest Filers, and optionally save the full report as JSON."""
+        report = self.report(top)
+        if not report['filers']:
+            return report
+        fleet = report['fleet']
+        logging.info("Fleet of %s Filers: CPU p95 mean %s%% max %s%%, memory p95 mean %s%% max %s%%",
+                     report['filers'], fleet['cpu_p95']['mean'], fleet['cpu_p95']['max'],
+                     fleet['memory_p95']['mean'], fleet['memory_p95']['max'])
+        for rank, entry in enumerate(report['hottest_cpu'], start=1):
+            logging.info("Hottest CPU #%s: %s/%s p95 %s%%", rank, entry['tenant'], entry['filer'], entry['cpu_p95'])
+        if filename:
+            with open(filename, mode='w', encoding='utf-8') as rollup_file:
+                json.dump(report, rollup_file, indent=2)
+            logging.info("Saved performance rollup to %s", filename)
+        return report
@@ -1,19 +1,25 @@
 import logging
 from getpass import getpass
 
-from cterasdk import CTERAException
+from bulk import select_devices, run_action
+from fleet import DEFAULT_WORKERS, DEFAULT_TIMEOUT
 
 
-def reset_filer_password(self, device_name, tenant_name, user_name, filer_password):
-    """Set/reset a local user's password on specified Filer"""
+def reset_filer_password(self, device_name, tenant_name, user_name, filer_password, device_file=None,
+                         workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, rate=None, results_file=None,
+                         inventory=None, selector=None):
+    """Set/reset a local user's password on specified Filers"""
     logging.info("Starting reset_password task.")
-    filer = self.devices.device(device_name, tenant_name)
     if filer_password == '?':
         filer_password = getpass(prompt='Filer password: ')
-    try:
-        filer.users.modify(user_name, filer_password)
+    devices = select_devices(self, device_name, tenant_name, device_file, inventory, selector)
+    records = run_action(self, f'password reset for {user_name}',
+                         lambda filer: filer.users.modify(user_name, filer_password), devices,
+                         workers, timeout, rate, results_file)
+    if not records:
+        logging.error("No devices selected. Password not set.")
+    elif all(record['state'] == 'success' for record in records):
         logging.info("Success. Password set for %s", user_name)
         logging.info("Finished reset_password task.")
-    except CTERAException as error:
-        logging.debug(error)
+    else:
         logging.error("Failed reset_password task.")
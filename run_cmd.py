@@ -1,61 +1,384 @@
+import hashlib
+import json
 import logging
+import os
+import sys
+import time
+from collections import Counter
 
 from cterasdk import CTERAException
-from filer import get_filer, get_filers
+from checkpoint import Checkpoint, CHECKPOINT_EVERY, DEFAULT_DIR
+from filer import get_filer, iter_filers, get_handle, get_tenant
+from fleet import call_with_retries, run_concurrently, DEFAULT_WORKERS, DEFAULT_TIMEOUT, DEFAULT_RETRIES
+from output import RecordWriter
+from timing import span
 
+RESULTS_HEADER = ['Tenant', 'Filer Name', 'State', 'Response', 'Error', 'Duration']
+RESULT_KEYS = ('tenant', 'filer', 'state', 'response', 'error', 'duration')
+# Running several commands adds the command to each result
+BATCH_RESULTS_HEADER = ['Tenant', 'Filer Name', 'Command', 'State', 'Response', 'Error', 'Duration']
+BATCH_RESULT_KEYS = ('tenant', 'filer', 'command', 'state', 'response', 'error', 'duration')
+# Longer responses are saved to the results file instead of the log
+MAX_LOGGED_RESPONSE = 500
+# Groups, and members per group, listed in the log. All are saved with --group-file
+MAX_LOGGED_GROUPS = 10
+MAX_LOGGED_MEMBERS = 20
 
-def single_filer_run(filer, command: str):
-    """Run command against a single device on current tenant.
 
-    :param str command: command to run
-    :param str device_name: Name of device on current tenant
+def read_script(path):
+    """Return the commands in a script file, one per line. Blank lines and # comments are skipped."""
+    with open(path, encoding='utf-8') as script:
+        return [line.strip() for line in script if line.strip() and not line.strip().startswith('#')]
+
+
+def single_filer_run(filer, commands, stop_on_error=False, results_file=None):
+    """Run commands in turn against a single device on current tenant.
+    Responses longer than MAX_LOGGED_RESPONSE characters aren't logged. They are saved
+    to results_file or, without one, to a run_cmd-<time>.jsonl file for this run.
+
+    :param filer: Device object, or None if it wasn't found
+    :param commands: command to run, or a list of commands
+    :param bool,optional stop_on_error: Don't run the commands after a failed one
+    :param str,optional results_file: CSV or JSONL file to write result records to
+    """
+    if filer is None:
+        # get_filer already logged that the device wasn't found.
+        return
+    commands = [commands] if isinstance(commands, str) else list(commands)
+    batch = len(commands) > 1
+    writer = open_results(results_file, BATCH_RESULTS_HEADER if batch else RESULTS_HEADER) if results_file else None
+    sink = None
+    tenant = get_tenant(filer)
+    try:
+        for command in commands:
+            record = {'tenant': tenant, 'filer': filer.name}
+            if batch:
+                record['command'] = command
+            start = time.monotonic()
+            try:
+                with span('cli.run_command', filer.name):
+                    response = filer.cli.run_command(command)
+                record.update(state='success', response=response, error=None)
+                sink = log_response(record, writer, sink)
+                logging.info("Finished single run_cmd task on %s", filer.name)
+            except AttributeError as ae:
+                logging.debug(ae)
+                continue
+            except CTERAException as ce:
+                logging.debug(ce)
+                logging.info("Failed run_cmd task on %s", filer.name)
+                record.update(state='failed', response=None, error=str(ce))
+            record['duration'] = round(time.monotonic() - start, 3)
+            if writer:
+                write_result(writer, record)
+            if stop_on_error and record['state'] == 'failed':
+                logging.warning("Stopping after the failed command: %s", command)
+                return
+    finally:
+        if writer:
+            writer.close()
+        if sink:
+            sink.close()
+
+
+def run_batch(device, commands, stop_on_error=False):
+    """
+    Run commands in turn on a device.
+    Return a (command, state, response, error, duration) tuple for each command.
+    Failed commands aren't retried, so the commands before them never run twice.
+    With stop_on_error, the commands after a failed one are 'skipped'.
+    """
+    outcomes = []
+    for command in commands:
+        if stop_on_error and outcomes and outcomes[-1][1] != 'success':
+            outcomes.append((command, 'skipped', None, 'Skipped after an earlier command failed', 0.0))
+            continue
+        start = time.monotonic()
+        try:
+            with span('cli.run_command', device.name):
+                response = device.cli.run_command(command)
+            outcomes.append((command, 'success', response, None, time.monotonic() - start))
+        except Exception as error:  # pylint: disable=broad-except
+            outcomes.append((command, 'failed', None, str(error), time.monotonic() - start))
+    return outcomes
+
+
+def result_record(result):
+    """Return a dict describing the outcome of a command on one Filer."""
+    return {'tenant': get_tenant(result.filer),
+            'filer': result.filer.name,
+            'state': result.state,
+            'response': result.value,
+            'error': str(result.error) if result.error else None,
+            'duration': round(result.duration, 3)}
+
+
+def batch_records(result, commands):
+    """Return a dict describing the outcome of each command of a batch on one Filer."""
+    if result.state == 'success':
+        outcomes = result.value
+    else:
+        # The Filer failed, timed out or was skipped as a whole.
+        outcomes = [(command, result.state, None, str(result.error), result.duration) for command in commands]
+    tenant = get_tenant(result.filer)
+    return [{'tenant': tenant, 'filer': result.filer.name, 'command': command, 'state': state,
+             'response': response, 'error': error, 'duration': round(duration, 3)}
+            for command, state, response, error, duration in outcomes]
+
+
+class ResponseGroups:
+    """
+    Filers grouped by identical response, for a compact report of fleet-wide output.
+    Each distinct response or error is stored once, keyed by command, state and a hash of its text.
+    The most common response to each command is taken as the baseline and other responses
+    are reported as drift.
     """
+
+    def __init__(self):
+        self.groups = {}
+
+    def add(self, record):
+        """Add a result record to its group. The record then shares the group's copy of the response."""
+        text = record['response'] if record['state'] == 'success' else record['error']
+        text = '' if text is None else str(text)
+        digest = hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()
+        key = (record.get('command'), record['state'], digest)
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = {'command': record.get('command'), 'state': record['state'],
+                                        'hash': digest, 'response': text, 'filers': []}
+        group['filers'].append(f"{record['tenant']}/{record['filer']}")
+        if record['state'] == 'success':
+            record['response'] = group['response']
+
+    def report(self):
+        """Return the groups of each command, largest first, with a count of their Filers."""
+        ordered = {}
+        for group in self.groups.values():
+            ordered.setdefault(group['command'], []).append(dict(group, count=len(group['filers'])))
+        return [group for groups in ordered.values()
+                for group in sorted(groups, key=lambda group: group['count'], reverse=True)]
+
+    def log(self):
+        """Log how many Filers returned each distinct response, and how many drift from the most common one."""
+        report = self.report()
+        for command in dict.fromkeys(group['command'] for group in report):
+            groups = [group for group in report if group['command'] == command]
+            total = sum(group['count'] for group in groups)
+            logging.info("%s: %s distinct results from %s Filers", repr(command) if command else 'Command',
+                         len(groups), total)
+            for group in groups[:MAX_LOGGED_GROUPS]:
+                preview = group['response'].strip().splitlines()[0][:80] if group['response'].strip() else ''
+                logging.info("  %s Filers %s [%s] %s", group['count'],
+                             'returned' if group['state'] == 'success' else group['state'], group['hash'], preview)
+                if group is not groups[0]:
+                    members = group['filers'][:MAX_LOGGED_MEMBERS]
+                    more = group['count'] - len(members)
+                    logging.info("    %s%s", ', '.join(members), f' and {more} more' if more else '')
+            if len(groups) > MAX_LOGGED_GROUPS:
+                logging.info("  %s more groups of %s Filers", len(groups) - MAX_LOGGED_GROUPS,
+                             sum(group['count'] for group in groups[MAX_LOGGED_GROUPS:]))
+            successes = [group for group in groups if group['state'] == 'success']
+            drift = sum(group['count'] for group in successes[1:])
+            if drift:
+                logging.warning("%s Filers differ from the most common response of %s Filers",
+                                drift, successes[0]['count'])
+
+    def write(self, filename):
+        """Save the groups, with each distinct response once and the Filers that returned it, as JSON."""
+        with open(filename, mode='w', encoding='utf-8') as group_file:
+            json.dump({'groups': self.report()}, group_file, indent=1)
+        logging.info("Saved %s response groups to %s", len(self.groups), filename)
+
+
+def open_results(results_file, header=RESULTS_HEADER):
+    """Open a CSV or JSONL results file, appending to it. Exit if it has other columns."""
     try:
-        response = filer.cli.run_command(command)
+        return RecordWriter(results_file, header=header)
+    except ValueError as error:
+        logging.error(error)
+        sys.exit("Invalid results file.")
+
+
+def write_result(writer, record):
+    """Write a result record as a CSV row or JSON line."""
+    if writer.fmt == 'csv':
+        writer.write([record[key] for key in (BATCH_RESULT_KEYS if 'command' in record else RESULT_KEYS)])
+    else:
+        writer.write(record)
+
+
+def log_response(record, writer, sink):
+    """
+    Log the response of a successful record, or where it's saved if it's longer than MAX_LOGGED_RESPONSE.
+    Long responses are saved to writer, which the caller writes every record to, or else to sink.
+    Return sink, which is opened when the first long response comes in without a writer.
+    """
+    response = str(record['response'])
+    if len(response) <= MAX_LOGGED_RESPONSE:
         logging.info(response)
-        logging.info("Finished single run_cmd task on %s", filer.name)
-    except AttributeError as ae:
-        logging.debug(ae)
-    except CTERAException as ce:
-        logging.debug(ce)
-        logging.info("Failed run_cmd task on %s", filer.name)
+        return sink
+    if writer is None and sink is None:
+        sink = RecordWriter(time.strftime('run_cmd-%Y%m%d-%H%M%S.jsonl'))
+        logging.info("Saving responses too long to log to %s", sink.filename)
+    logging.info("Saved %s character response to %s", len(response), (writer or sink).filename)
+    if sink:
+        write_result(sink, record)
+    return sink
 
 
-def multi_filer_run(self, command: str, all_tenants=False):
+def multi_filer_run(self, command, all_tenants=False, workers=DEFAULT_WORKERS,
+                    timeout=DEFAULT_TIMEOUT, results_file=None, inventory=None, retries=DEFAULT_RETRIES, breaker=None,
+                    resume=False, shard=None, selector=None, stop_on_error=False, group=False, group_file=None):
     """Run command against all devices on a tenant or all tenants.
+    Filers are run concurrently. Return a result record for each Filer.
+    Given a list of commands, they run in turn on each Filer with one device handle,
+    and a result record is returned for each command on each Filer.
+    Filers that succeeded are checkpointed, so an interrupted run can resume.
+    The checkpoint is kept per commands and scope, i.e. Tenant or all Tenants, selector and shard.
+    Responses longer than MAX_LOGGED_RESPONSE characters aren't logged. They are saved
+    to results_file or, without one, to a run_cmd-<time>.jsonl file for this run.
+    With group, responses aren't logged. Filers are grouped by identical response instead.
 
-    :param str command: command to run
+    :param command: command to run, or a list of commands to run in turn
     :param bool,optional all_tenants: Scan all tenants
+    :param int,optional workers: Number of Filers to run on at once, or an AdaptiveLimit
+    :param int,optional timeout: Seconds allowed per Filer, for all its commands
+    :param str,optional results_file: CSV or JSONL file to write result records to
+    :param Inventory,optional inventory: Start from cached Filer inventory
+    :param int,optional retries: Retries of transient errors getting each Filer's device, within its timeout.
+        Commands aren't retried, as they may not be safe to run twice
+    :param CircuitBreaker,optional breaker: Skip Filers that failed in recent runs
+    :param bool,optional resume: Skip Filers that succeeded in the last unfinished run of this command
+    :param tuple,optional shard: Only run on this (index, count) shard of the Filers
+    :param Selector,optional selector: Only run on the Filers it matches
+    :param bool,optional stop_on_error: Skip the rest of a Filer's commands after one fails
+    :param bool,optional group: Log groups of Filers with identical responses instead of each response
+    :param str,optional group_file: Save the response groups to this JSON file. Implies group
     """
-    filers = get_filers(self, all_tenants)
-    for filer in filers:
-        try:
-            logging.info("Running command on: %s", filer.name)
-            response = filer.cli.run_command(command)
-            logging.info(response)
-            logging.info("Finished command on: %s", filer.name)
-        except CTERAException as error:
-            logging.debug(error)
-            logging.warning("Something went wrong running the command on %s", filer.name)
+    commands = [command] if isinstance(command, str) else list(command)
+    batch = len(commands) > 1
+
+    def run_command(filer):
+        logging.info("Running command on: %s", filer.name)
+        device = call_with_retries(lambda entry: get_handle(self, entry), filer, retries, timeout=timeout)
+        if batch:
+            return run_batch(device, commands, stop_on_error)
+        with span('cli.run_command', filer.name):
+            return device.cli.run_command(commands[0])
+
+    records = []
+    writer = open_results(results_file, BATCH_RESULTS_HEADER if batch else RESULTS_HEADER) if results_file else None
+    scope = 'all tenants' if all_tenants else self.users.session().user.tenant
+    key = '\n'.join(commands + [f'scope {scope} selector {selector} shard {shard}'])
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+    checkpoint_file = (results_file + '.checkpoint' if results_file else
+                       os.path.join(DEFAULT_DIR, f'run_cmd-{digest}.checkpoint'))
+    checkpoint = Checkpoint(checkpoint_file, key, resume)
+    # A resumed run tries failed Filers again, so their records wait for the end of the run.
+    failures = []
+    # Results file for responses too long to log, opened when the first one comes in
+    sink = None
+    groups = ResponseGroups() if group or group_file else None
+    try:
+        filers = iter_filers(self, all_tenants, inventory, shard, selector, compact=True, keep_devices=True)
+        filers = checkpoint.filter(filers)
+        skip = breaker.reason if breaker else None
+        for result in run_concurrently(run_command, filers, workers, timeout, skip=skip):
+            filer_records = batch_records(result, commands) if batch else [result_record(result)]
+            records.extend(filer_records)
+            errors = [record['error'] for record in filer_records if record['state'] in ('failed', 'timeout')]
+            if breaker and result.state != 'skipped':
+                breaker.record(get_tenant(result.filer), result.filer.name, errors[0] if errors else None)
+            for record in filer_records:
+                if groups:
+                    # Responses are reported per group once all Filers are done.
+                    groups.add(record)
+                if record['state'] == 'success' and not groups:
+                    sink = log_response(record, writer, sink)
+                elif record['state'] == 'failed':
+                    logging.debug(record['error'])
+                    logging.warning("Something went wrong running %s on %s",
+                                    repr(record['command']) if batch else 'the command', record['filer'])
+            if writer and (result.state != 'success' or errors):
+                failures.extend(filer_records)
+            elif writer:
+                for record in filer_records:
+                    write_result(writer, record)
+            if result.state == 'success':
+                logging.info("Finished command on: %s", result.filer.name)
+            if result.state == 'success' and not errors:
+                checkpoint.mark(get_tenant(result.filer), result.filer.name)
+                if checkpoint.pending >= CHECKPOINT_EVERY:
+                    if writer:
+                        writer.flush()
+                    checkpoint.commit()
+        if writer:
+            for record in failures:
+                write_result(writer, record)
+            writer.close()
+            writer = None
+        checkpoint.complete()
+    finally:
+        if writer:
+            writer.close()
+        if sink:
+            sink.close()
+        checkpoint.commit()
+        checkpoint.close()
+    if groups:
+        groups.log()
+        if group_file:
+            groups.write(group_file)
+    states = Counter(record['state'] for record in records)
+    logging.info("Command results: %s succeeded, %s failed, %s timed out, %s skipped",
+                 states['success'], states['failed'], states['timeout'], states['skipped'])
+    return records
 
 
-def run_cmd(self, command: str, all_tenants=False, device_name=None):
+def run_cmd(self, command, all_tenants=False, device_name=None,
+            workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, results_file=None, inventory=None,
+            retries=DEFAULT_RETRIES, breaker=None, resume=False, shard=None, selector=None,
+            script=None, stop_on_error=False, group=False, group_file=None):
     """Run a "hidden CLI command" on connected Filers.
     i.e. execute a RESTful API request to connected Filers, and
     print the response. On CLI, quote the command string.
+    Several commands, given as a list or in a script file, run in turn on each Filer in a single pass.
 
-    :param str command: command to be run
+    :param command: command to be run, or a list of commands
     :param bool,optional all_tenants: Scan all tenants true or false
     :param str,optional device_name: Name of device on current tenant
+    :param int,optional workers: Number of Filers to run on at once, or an AdaptiveLimit
+    :param int,optional timeout: Seconds allowed per Filer
+    :param str,optional results_file: CSV or JSONL file to write result records to
+    :param Inventory,optional inventory: Start from cached Filer inventory
+    :param int,optional retries: Retries of transient errors getting each Filer's device, within its timeout
+    :param CircuitBreaker,optional breaker: Skip Filers that failed in recent runs
+    :param bool,optional resume: Skip Filers that succeeded in the last unfinished run of this command
+    :param tuple,optional shard: Only run on this (index, count) shard of the Filers
+    :param Selector,optional selector: Only run on the Filers it matches, e.g. by Tenant, name glob or firmware
+    :param str,optional script: File of commands to run after command, one per line
+    :param bool,optional stop_on_error: Skip the rest of a Filer's commands after one fails
+    :param bool,optional group: Log groups of Filers with identical responses instead of each response
+    :param str,optional group_file: Save the response groups to this JSON file. Implies group
     """
     logging.info('Starting run_cmd task.')
+    commands = [command] if isinstance(command, str) else list(command or [])
+    if script:
+        commands += read_script(script)
+    if not commands:
+        logging.error("No command given. Give one or more commands or a script file.")
+        return
     tenant = self.users.session().user.tenant
     if device_name:
         filer = get_filer(self, device_name, tenant)
-        single_filer_run(filer, command)
-    elif all_tenants is True:
-        multi_filer_run(self, command, all_tenants=True)
-        logging.info('Finished run_cmd task on all Filers.')
+        single_filer_run(filer, commands, stop_on_error, results_file)
     else:
-        multi_filer_run(self, command, all_tenants=False)
-        logging.info("Finished run_cmd task on all Filers in Tenant: %s", tenant)
+        multi_filer_run(self, commands, all_tenants=all_tenants is True, workers=workers, timeout=timeout,
+                        results_file=results_file, inventory=inventory, retries=retries, breaker=breaker,
+                        resume=resume, shard=shard, selector=selector, stop_on_error=stop_on_error, group=group,
+                        group_file=group_file)
+        if all_tenants is True:
+            logging.info('Finished run_cmd task on all Filers.')
+        else:
+            logging.info("Finished run_cmd task on all Filers in Tenant: %s", tenant)
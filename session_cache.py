@@ -0,0 +1,72 @@
+import json
+import logging
+import os
+import time
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.ctools', 'sessions.json')
+# Skip the Allow Single Sign On to Devices check if it passed this recently.
+SSO_CHECK_INTERVAL = 24 * 3600
+
+
+class SessionCache:
+    """
+    Opt-in cache of authenticated Portal session IDs, keyed by user and address.
+
+    Only session IDs are stored, never passwords. The file is created readable
+    and writable by the owner only. A cached session lasts until the Portal
+    expires it, so treat the file like a credential.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+
+    def _read(self):
+        try:
+            with open(self.path, encoding='utf-8') as cache_file:
+                return json.load(cache_file)
+        except FileNotFoundError:
+            return {}
+        except ValueError as error:
+            logging.debug(error)
+            logging.warning("Ignoring unreadable session cache %s", self.path)
+            return {}
+
+    def _write(self, sessions):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        descriptor = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as cache_file:
+            json.dump(sessions, cache_file)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _key(address, username):
+        return f"{username}@{address}"
+
+    def get(self, address, username):
+        """Return the cached entry for a user on a Portal, or None."""
+        return self._read().get(self._key(address, username))
+
+    def save(self, address, username, session_id, sso_checked=None):
+        """Store a session ID, keeping the last SSO check time unless a new one is given."""
+        sessions = self._read()
+        key = self._key(address, username)
+        previous = sessions.get(key) or {}
+        sessions[key] = {'session_id': session_id,
+                         'saved': time.time(),
+                         'sso_checked': sso_checked if sso_checked is not None else previous.get('sso_checked')}
+        self._write(sessions)
+
+    def remove(self, address, username):
+        """Forget the cached session for a user on a Portal."""
+        sessions = self._read()
+        if sessions.pop(self._key(address, username), None) is not None:
+            self._write(sessions)
+
+    def sso_recently_checked(self, address, username):
+        """Return True if the SSO check passed within SSO_CHECK_INTERVAL."""
+        entry = self.get(address, username) or {}
+        checked = entry.get('sso_checked')
+        return checked is not None and time.time() - checked < SSO_CHECK_INTERVAL
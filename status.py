@@ -1,191 +1,260 @@
-import csv
 import logging
 import os
+import sqlite3
 import sys
-from filer import get_filers
-
-
-def write_status(self, p_filename, all_tenants):
-    """Save and write Filer status information to given filename."""
-    get_list = ['config',
-                'status',
-                'proc/cloudsync',
-                'proc/time/',
-                'proc/storage/summary',
-                'proc/perfMonitor']
-    for filer in get_filers(self, all_tenants):
-        info = filer.get_multi('', get_list)
-        tenant = filer.session().user.tenant
-        sync_id = info.proc.cloudsync.serviceStatus.id
-        try:
-            selfScanIntervalInHours = info.config.cloudsync.selfScanVerificationIntervalInHours
-        except AttributeError:
-            selfScanIntervalInHours = 'Not Applicable'
-        uploadingFiles = info.proc.cloudsync.serviceStatus.uploadingFiles
-        scanningFiles = info.proc.cloudsync.serviceStatus.scanningFiles
-        try:
-            selfVerificationscanningFiles = info.proc.cloudsync.serviceStatus.selfVerificationScanningFiles
-        except AttributeError:
-            selfVerificationscanningFiles = 'Not Applicable'
-        CurrentFirmware = info.status.device.runningFirmware
-        try:
-            MetaLogMaxSize = info.config.logging.metalog.maxFileSizeMB
-        except AttributeError:
-            try:
-                MetaLogMaxSize = info.config.logging.log2File.maxFileSizeMB
-            except AttributeError:
-                MetaLogMaxSize = 'Not Applicable'
-        try:
-            MetaLogMaxFiles = info.config.logging.metalog.maxfiles
-        except AttributeError:
-            try:
-                MetaLogMaxFiles = info.config.logging.log2File.maxfiles
-            except AttributeError:
-                MetaLogMaxFiles = 'Not Applicable'
-        try:
-            MetaLogs = filer.cli.run_command('dbg level')
-            MetaLogs1 = MetaLogs[-28:-18]
-        except AttributeError:
-            MetaLogs1 = 'Not Applicable'
-        License = filer.licenses.get()
-        # License = info.config.device.activeLicenseType
-        IP1 = info.status.network.ports[0].ip.address
-        DNS1 = info.status.network.ports[0].ip.DNSServer1
-        DNS2 = info.status.network.ports[0].ip.DNSServer2
-        try:
-            storageThresholdPercentTrigger = info.config.cloudsync.cloudExtender.storageThresholdPercentTrigger
-        except AttributeError:
-            storageThresholdPercentTrigger = 'Not Applicable'
-        uptime = info.proc.time.uptime
-        curr_cpu = info.proc.perfMonitor.current.cpu
-        curr_mem = info.proc.perfMonitor.current.memUsage
-        _total = info.proc.storage.summary.totalVolumeSpace
-        _used = info.proc.storage.summary.usedVolumeSpace
-        _free = info.proc.storage.summary.freeVolumeSpace
-        volume = (f"Total: {_total} Used: {_used} Free: {_free}")
-        # dbg_level = filer.support.set_debug_level()
-        # MetaLogs1 = dbg_level[-28:-18]
-        Alerts = info.config.logging.alert
-        TimeServer = info.config.time
-        _mode = TimeServer.NTPMode
-        _zone = TimeServer.TimeZone
-        _servers = TimeServer.NTPServer
-        time = (f"Mode: {_mode} Zone: {_zone} Servers: {_servers}")
-
-        def get_max_cpu(samples=info.proc.perfMonitor.samples):
-            """Return the max CPU usage recorded in last few hours."""
-            cpu_history = []
-            for i in samples:
-                cpu_history.append(i.cpu)
-            max_cpu = format(max(cpu_history))
-            return f"{max_cpu}%"
-
-        def get_max_memory(samples=info.proc.perfMonitor.samples):
-            """Return the max memory usage recorded in last few hours."""
-            memory_history = []
-            for i in samples:
-                memory_history.append(i.memUsage)
-            max_memory = format(max(memory_history))
-            return f"{max_memory}%"
-
-        def get_ad_status(result=info.status.fileservices.cifs.joinStatus):
-            """
-            Parse domain join value and return the Domain Join Status as string.
-            joinStatus: -1 = workgroup, 0 = OK, 2 = Failed
-            """
-            if result == 0:
-                return 'Ok'
-            if result == -1:
-                return 'Workgroup'
-            if result == 2:
-                return 'Failed'
-            return result
-
-        with open(p_filename, mode='a', newline='', encoding="utf-8-sig") as gatewayList:
-            gateway_writer = csv.writer(gatewayList,
-                                        dialect='excel',
-                                        delimiter=',',
-                                        quotechar='"',
-                                        quoting=csv.QUOTE_MINIMAL)
-
-            gateway_writer.writerow([
-                    tenant,
-                    filer.name,
-                    sync_id,
-                    selfScanIntervalInHours,
-                    uploadingFiles,
-                    scanningFiles,
-                    selfVerificationscanningFiles,
-                    MetaLogs1,
-                    MetaLogMaxSize,
-                    MetaLogMaxFiles,
-                    CurrentFirmware,
-                    License,
-                    storageThresholdPercentTrigger,
-                    volume,
-                    IP1,
-                    DNS1,
-                    DNS2,
-                    get_ad_status(),
-                    Alerts,
-                    time,
-                    uptime,
-                    f"CPU: {curr_cpu}% Mem: {curr_mem}%",
-                    get_max_cpu(),
-                    get_max_memory()
-                    ])
-    self.logout()
-
-
-def write_header(p_filename):
-    """Write CSV header to given filename parameter """
+from columns import FIELDS, SETTINGS_FIELDS, fields_for, header, paths_for, row, select_columns
+from filer import iter_filers, get_handle, get_tenant
+from timing import span
+from fleet import run_concurrently, DEFAULT_WORKERS, DEFAULT_TIMEOUT, DEFAULT_RETRIES
+from delta import DeltaState, DEFAULT_FULL_EVERY, DEFAULT_CONFIG_EVERY
+from history import HistoryWriter
+from archive import SampleArchive
+from checkpoint import Checkpoint, CHECKPOINT_EVERY
+from perfstats import Rollup, config as perfstats_config
+from output import RecordWriter, guess_format, read_header, DEFAULT_FLUSH_ROWS, DEFAULT_FLUSH_BYTES
+
+
+def has_settings(previous, fields):
+    """Return True if a previous record has all the SETTINGS_FIELDS among fields, e.g. not after a change of columns."""
+    return previous is not None and all(name in previous for name in fields if name in SETTINGS_FIELDS)
+
+
+def get_status_record(filer, fields=None, previous=None):
+    """
+    Collect status information from a Filer and return it as a dict.
+    Values keep their API types. Fields that don't apply to the Filer are None.
+    Only the get_multi paths and extra calls needed for fields are requested.
+    If a previous record has all the SETTINGS_FIELDS among fields, they are reused instead of fetched.
+
+    :param filer: Filer device object
+    :param list[str],optional fields: Record fields to collect. Default all
+    :param dict,optional previous: Previous record of the Filer
+    """
+    fields = fields or list(FIELDS)
+    reused = [name for name in fields if name in SETTINGS_FIELDS] if has_settings(previous, fields) else []
+    fetched = [name for name in fields if name not in reused]
+    paths = paths_for(fetched)
+    info = None
+    if paths:
+        with span('get_multi', filer.name):
+            info = filer.get_multi('', paths)
+    record, shared = {}, {}
+    for name in fetched:
+        field = FIELDS[name]
+        if field.calls:
+            with span(', '.join(field.calls), filer.name):
+                record[name] = field.extract(filer, info)
+        elif field.key is None:
+            record[name] = field.extract(filer, info)
+        else:
+            if field.extract not in shared:
+                shared[field.extract] = field.extract(filer, info)
+            record[name] = shared[field.extract][field.key]
+    record.update((name, previous.get(name)) for name in reused)
+    return record
+
+
+def write_failure(writer, failure, columns):
+    """
+    Write the record of a Filer that failed. CSV rows only have room for the reason with the error column.
+    Return False if the record was left out.
+    """
+    if writer.fmt != 'csv':
+        writer.write(failure)
+    elif 'error' in columns:
+        writer.write(row(failure, columns))
+    else:
+        return False
+    return True
+
+
+def write_status(self, writer, all_tenants, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, inventory=None,
+                 delta=None, columns=None, rollup_file=None, archive=None, filers=None, metrics=None,
+                 spacing=0, retries=DEFAULT_RETRIES, breaker=None, checkpoint=None, shard=None,
+                 selector=None):
+    """
+    Save and write Filer status information to given writer.
+    Filers are collected concurrently while Tenants are still being browsed,
+    and rows are written as they finish.
+
+    :param RecordWriter writer: open output writer, or None to only update metrics
+    :param bool all_tenants: Scan all tenants
+    :param int,optional workers: Number of Filers to collect at once, or an AdaptiveLimit
+    :param int,optional timeout: Seconds allowed per Filer
+    :param Inventory,optional inventory: Start from cached Filer inventory
+    :param DeltaState,optional delta: Previous snapshots for an incremental sweep.
+        JSONL output then only records changed fields between full snapshots.
+    :param list[str],optional columns: Output columns to collect. Default the original CSV columns
+    :param str,optional rollup_file: JSON file for the performance rollup, if stats columns are selected
+    :param SampleArchive,optional archive: Archive each Filer's new raw perfMonitor samples
+    :param filers: Iterable of Filers to collect. Default all Filers of the Tenant or Portal
+    :param Metrics,optional metrics: Latest per Filer metrics to update, for watch
+    :param float,optional spacing: Minimum seconds between Filer polls, to spread the load
+    :param int,optional retries: Retries of transient errors per Filer, within its timeout
+    :param CircuitBreaker,optional breaker: Skip Filers that failed in recent runs
+    :param Checkpoint,optional checkpoint: Skip Filers completed earlier in the sweep and mark new ones
+    :param tuple,optional shard: Only collect this (index, count) shard of the Filers
+    :param Selector,optional selector: Only collect the Filers it matches
+    """
+    columns = columns or select_columns()
+    fields = fields_for(columns)
+    if archive:
+        fields.append('perf_samples')
+    rollup = Rollup() if 'cpu_p95' in fields else None
+
+    def collect(filer):
+        # A device object's session follows the Portal to the Tenant it browses next,
+        # so take the Tenant from the entry, as it was when the Filer was listed.
+        tenant = get_tenant(filer)
+        device = get_handle(self, filer)
+        previous = delta.reusable_config(tenant, filer.name) if delta else None
+        if previous is not None and not has_settings(previous, fields):
+            logging.debug("Previous record of %s lacks settings columns. Fetching config.", filer.name)
+            previous = None
+        record = get_status_record(device, fields, previous)
+        if previous is not None and 'firmware' in record and record['firmware'] != previous.get('firmware'):
+            logging.debug("Firmware changed on %s. Fetching config.", filer.name)
+            previous = None
+            record = get_status_record(device, fields)
+        record['tenant'] = tenant
+        return record, previous is not None
+
+    if filers is None:
+        filers = iter_filers(self, all_tenants, inventory, shard, selector, compact=True, keep_devices=True)
+    if checkpoint:
+        filers = checkpoint.filter(filers)
+    skip = breaker.reason if breaker else None
+    # A resumed sweep tries failed Filers again, so with a checkpoint their rows wait for the end of the sweep.
+    failures = []
+    dropped = 0
+    for result in run_concurrently(collect, filers, workers, timeout, spacing, retries, skip=skip):
+        if result.state == 'success':
+            record, config_reused = result.value
+            if breaker:
+                breaker.record(record['tenant'], record['filer'])
+            if archive:
+                archive.append(record['tenant'], record['filer'], record.pop('perf_samples'))
+            if rollup:
+                rollup.add(record)
+            if metrics:
+                metrics.update(record, result.duration)
+            changes = delta.update(record, config_reused) if delta else record
+            if writer is not None and writer.fmt == 'csv':
+                writer.write(row(record, columns))
+            elif writer is not None and writer.fmt == 'jsonl':
+                writer.write(changes)
+            elif writer is not None:
+                writer.write(record)
+            if checkpoint:
+                checkpoint.mark(record['tenant'], record['filer'])
+                if checkpoint.pending >= CHECKPOINT_EVERY:
+                    if writer is not None:
+                        writer.flush()
+                    checkpoint.commit()
+        else:
+            error = f'{type(result.error).__name__}: {result.error}' if result.state == 'failed' else str(result.error)
+            failure = {'tenant': get_tenant(result.filer), 'filer': result.filer.name, 'error': error}
+            if result.state != 'skipped':
+                logging.debug(result.error)
+                logging.warning("Unable to collect status from %s", result.filer.name)
+                if breaker:
+                    breaker.record(failure['tenant'], failure['filer'], str(result.error))
+            if metrics:
+                metrics.down(failure['tenant'], failure['filer'], result.duration)
+            if writer is not None and checkpoint:
+                failures.append(failure)
+            elif writer is not None and not write_failure(writer, failure, columns):
+                dropped += 1
+    for failure in failures:
+        if not write_failure(writer, failure, columns):
+            dropped += 1
+    if dropped:
+        logging.warning("%s failed Filers were left out of %s, which has no Error column. "
+                        "Write to a new file to record them.", dropped, writer.filename)
+    if rollup:
+        rollup.log(filename=rollup_file)
+    if archive:
+        logging.info("Archived %s new perfMonitor samples in %s", archive.samples, archive.directory)
+
+
+def appendable_columns(filename, fmt, compress, columns):
+    """
+    Return the columns to write to filename. An existing CSV file that only lacks the error column,
+    e.g. one started before Error was a default column, keeps its columns.
+    """
+    if 'error' not in columns or (fmt or guess_format(filename)) != 'csv' or not os.path.isfile(filename):
+        return columns
+    without_error = [name for name in columns if name != 'error']
+    try:
+        if read_header(filename, compress) == header(without_error):
+            return without_error
+    except OSError:
+        pass
+    return columns
+
+
+def open_status_output(p_filename, fmt=None, compress=None,
+                       flush_rows=DEFAULT_FLUSH_ROWS, flush_bytes=DEFAULT_FLUSH_BYTES, columns=None):
+    """
+    Open given filename parameter for writing, adding a CSV header to new files.
+    The sqlite format records the sweep in an indexed status history database.
+    """
     try:
-        with open(p_filename, mode='a', newline='', encoding="utf-8-sig") as gatewayList:
-            gateway_writer = csv.writer(
-                    gatewayList,
-                    dialect='excel',
-                    delimiter=',',
-                    quotechar='"',
-                    quoting=csv.QUOTE_MINIMAL
-                    )
-            gateway_writer.writerow(['Tenant',
-                                     'Filer Name',
-                                     'CloudSync Status',
-                                     'selfScanIntervalInHours',
-                                     'uploadingFiles',
-                                     'scanningFiles',
-                                     'selfVerificationscanningFiles',
-                                     'MetaLogsSetting',
-                                     'MetaLogMaxSize',
-                                     'MetaLogMaxFiles',
-                                     'CurrentFirmware',
-                                     'License',
-                                     'EvictionPercentage',
-                                     'CurrentVolumeStorage',
-                                     'IP Config',
-                                     'DNS Server1',
-                                     'DNS Server2',
-                                     'AD Domain Status',
-                                     'Alerts',
-                                     'TimeServer',
-                                     'uptime',
-                                     'Current Performance',
-                                     'Max CPU',
-                                     'Max Memory'
-                                     ])
-    except FileNotFoundError as error:
+        if (fmt or guess_format(p_filename)) == 'sqlite':
+            return HistoryWriter(p_filename, flush_rows)
+        return RecordWriter(p_filename, fmt, header(columns or select_columns()), compress, flush_rows, flush_bytes)
+    except (FileNotFoundError, sqlite3.OperationalError) as error:
         logging.error(error)
         logging.info("ERROR: Unable to open filename specified: %s", p_filename)
         sys.exit("Make sure you entered a valid file name and it exists")
+    except ValueError as error:
+        logging.error(error)
+        sys.exit("Invalid output file.")
 
 
-def run_status(self, filename, all_tenants):
-    """Log start/end of task and call main function."""
+def run_status(self, filename, all_tenants, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT,
+               fmt=None, compress=None, flush_rows=DEFAULT_FLUSH_ROWS, flush_bytes=DEFAULT_FLUSH_BYTES,
+               inventory=None, incremental=False, full_every=DEFAULT_FULL_EVERY, config_every=DEFAULT_CONFIG_EVERY,
+               columns=None, rollup_file=None, threshold=None, archive_dir=None, retries=DEFAULT_RETRIES,
+               breaker=None, resume=False, shard=None, selector=None):
+    """
+    Log start/end of task and call main function.
+    For incremental sweeps, previous snapshots are kept next to the output in <filename>.state.
+    Columns are column or column set names from the columns registry. Default is the original CSV columns and Error.
+    Threshold is the percent usage counted as time above threshold in stats columns.
+    With archive_dir, raw perfMonitor samples are also appended to a per Filer archive there.
+    Filers that fail, time out or are skipped by the circuit breaker are written with an error,
+    in CSV output only if the error column is selected, as it is by default.
+    Completed Filers are checkpointed in <filename>.checkpoint, and failed Filers are only written
+    at the end of the sweep. With resume, an unfinished sweep continues and skips the Filers it
+    already collected. The checkpoint is removed once the sweep completes.
+    With shard, an (index, count) tuple, only that slice of the Filers is collected.
+    Use a separate filename per shard and combine them with the merge task.
+    With a Selector, only the Filers it matches are collected.
+    """
     logging.info('Starting status task')
-    if os.path.exists(filename):
-        logging.info('Appending to existing file.')
-    else:
-        logging.debug('File does not exist. Creating it.')
-        write_header(filename)
-    write_status(self, filename, all_tenants)
+    try:
+        columns = select_columns(columns)
+    except ValueError as error:
+        logging.error(error)
+        sys.exit("Invalid columns.")
+    columns = appendable_columns(filename, fmt, compress, columns)
+    if threshold is not None:
+        perfstats_config['threshold'] = threshold
+    delta = DeltaState(filename + '.state', full_every, config_every) if incremental else None
+    archive = SampleArchive(archive_dir) if archive_dir else None
+    key = filename if shard is None else f'{filename} shard {shard[0]}/{shard[1]}'
+    checkpoint = Checkpoint(filename + '.checkpoint', key, resume)
+    try:
+        with open_status_output(filename, fmt, compress, flush_rows, flush_bytes, columns) as writer:
+            write_status(self, writer, all_tenants, workers=workers, timeout=timeout, inventory=inventory,
+                         delta=delta, columns=columns, rollup_file=rollup_file, archive=archive, retries=retries,
+                         breaker=breaker, checkpoint=checkpoint, shard=shard, selector=selector)
+        checkpoint.complete()
+    finally:
+        # The output is closed and flushed by now, so marked Filers can be saved.
+        checkpoint.commit()
+        checkpoint.close()
+        if delta:
+            delta.close()
     logging.info('Finished status task.')
@@ -1,14 +1,58 @@
 import logging
-from cterasdk import CTERAException
+import time
+from bulk import select_devices, run_action
+from fleet import run_concurrently, DEFAULT_WORKERS, DEFAULT_TIMEOUT
 
+# Seconds between checks of whether suspended devices stopped syncing
+POLL_INTERVAL = 5
+# cterasdk SyncStatus values: sync has stopped, or can't be suspended as the sync service is failing
+SYNC_OFF = 'Off'
+SYNC_FAILED = {'DisconnectedPortal', 'Unlicensed', 'ServiceUnavailable', 'VolumeUnavailable', 'ShouldSupportWinNtAcl',
+               'InternalError', 'ClocksOutOfSync', 'NoFolder'}
 
-def suspend_filer_sync(self=None, device_name=None, tenant_name=None):
-    """Suspend sync on a device"""
+
+def wait_for_suspension(devices, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, interval=POLL_INTERVAL):
+    """
+    Poll the sync status of suspended devices together until each has stopped syncing.
+    Return a (state, error) tuple by FilerEntry for the devices that failed or didn't stop within timeout seconds.
+
+    :param dict devices: Device objects by FilerEntry
+    :param int,optional workers: Number of devices to check at once, or an AdaptiveLimit
+    :param int,optional timeout: Seconds allowed for all devices to stop syncing. 0 or None to wait indefinitely
+    :param float,optional interval: Seconds between checks
+    """
+    deadline = time.monotonic() + timeout if timeout else None
+    pending = list(devices)
+    unconfirmed = {}
+    while pending:
+        logging.info("Waiting for sync to stop on %s devices", len(pending))
+        syncing = []
+        for result in run_concurrently(lambda entry: devices[entry].sync.get_status().id, pending, workers, timeout):
+            if result.state != 'success':
+                logging.warning("Failed to check sync on %s", result.filer.name)
+                unconfirmed[result.filer] = (result.state, str(result.error))
+            elif result.value in SYNC_FAILED:
+                logging.warning("Sync can't be suspended on %s: %s", result.filer.name, result.value)
+                unconfirmed[result.filer] = ('failed', f'Sync status is {result.value}')
+            elif result.value != SYNC_OFF:
+                syncing.append(result.filer)
+        pending = syncing
+        if pending and deadline is not None and time.monotonic() + interval > deadline:
+            for entry in pending:
+                logging.warning("Sync didn't stop within %ss on %s", timeout, entry.name)
+                unconfirmed[entry] = ('timeout', f'Sync did not stop within {timeout}s')
+            break
+        if pending:
+            time.sleep(interval)
+    return unconfirmed
+
+
+def suspend_filer_sync(self=None, device_name=None, tenant_name=None, device_file=None, workers=DEFAULT_WORKERS,
+                       timeout=DEFAULT_TIMEOUT, rate=None, results_file=None, inventory=None, selector=None):
+    """Suspend sync on devices, then wait for all of them to stop syncing"""
     logging.info("Starting suspend sync task.")
-    device = self.devices.device(device_name, tenant_name)
-    try:
-        device.sync.suspend(wait=True)
-        logging.info("Suspended sync on %s", device.name)
-    except CTERAException as e:
-        logging.warning(e)
-        logging.info("Error suspending sync on %s", device.name)
+    devices = select_devices(self, device_name, tenant_name, device_file, inventory, selector)
+    run_action(self, 'suspend sync', lambda device: device.sync.suspend(wait=False), devices,
+               workers, timeout, rate, results_file,
+               confirm=lambda suspended: wait_for_suspension(suspended, workers, timeout))
+    logging.info("Finished suspend sync task.")
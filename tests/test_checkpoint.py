@@ -0,0 +1,59 @@
+import os
+
+from checkpoint import Checkpoint
+from filer import FilerEntry
+
+FILERS = [FilerEntry('tenant', name) for name in ('a', 'b', 'c')]
+
+
+def names(checkpoint):
+    return [filer.name for filer in checkpoint.filter(FILERS)]
+
+
+def interrupted(path, key='sweep'):
+    checkpoint = Checkpoint(path, key)
+    checkpoint.mark('tenant', 'a')
+    checkpoint.mark('tenant', 'b')
+    checkpoint.commit()
+    # Marked, but its result was never flushed
+    checkpoint.mark('tenant', 'c')
+    checkpoint.close()
+
+
+def test_resume_skips_committed_filers(tmp_path):
+    path = str(tmp_path / 'status.checkpoint')
+    interrupted(path)
+    checkpoint = Checkpoint(path, 'sweep', resume=True)
+    assert names(checkpoint) == ['c']
+    checkpoint.close()
+
+
+def test_a_new_sweep_starts_over(tmp_path):
+    path = str(tmp_path / 'status.checkpoint')
+    interrupted(path)
+    checkpoint = Checkpoint(path, 'sweep')
+    assert names(checkpoint) == ['a', 'b', 'c']
+    checkpoint.close()
+    # The first run without --resume cleared the interrupted sweep.
+    checkpoint = Checkpoint(path, 'sweep', resume=True)
+    assert names(checkpoint) == ['a', 'b', 'c']
+    checkpoint.close()
+
+
+def test_another_sweep_is_not_resumed(tmp_path):
+    path = str(tmp_path / 'status.checkpoint')
+    interrupted(path)
+    checkpoint = Checkpoint(path, 'other sweep', resume=True)
+    assert names(checkpoint) == ['a', 'b', 'c']
+    checkpoint.close()
+
+
+def test_complete_removes_the_checkpoint(tmp_path):
+    path = str(tmp_path / 'status.checkpoint')
+    checkpoint = Checkpoint(path, 'sweep')
+    checkpoint.mark('tenant', 'a')
+    checkpoint.complete()
+    assert not os.path.exists(path)
+    checkpoint = Checkpoint(path, 'sweep', resume=True)
+    assert names(checkpoint) == ['a', 'b', 'c']
+    checkpoint.close()
@@ -0,0 +1,10 @@
+from types import SimpleNamespace
+
+from columns import COLUMNS
+from delta import normalize
+
+
+def test_reused_alerts_print_like_fetched_ones():
+    fetched = {'alerts': SimpleNamespace(minSeverity='Warning')}
+    reused = normalize(fetched)
+    assert COLUMNS['alerts'].format(reused) == COLUMNS['alerts'].format(fetched)
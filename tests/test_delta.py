@@ -0,0 +1,41 @@
+from delta import DeltaState
+
+
+def record(**fields):
+    return dict({'tenant': 'tenant', 'filer': 'filer', 'uptime': '1 day', 'config': {'dns': '10.0.0.1'}}, **fields)
+
+
+def test_first_snapshot_is_full(tmp_path):
+    state = DeltaState(str(tmp_path / 'status.state'))
+    assert state.update(record()) == dict(record(), snapshot='full')
+    state.close()
+
+
+def test_later_snapshots_hold_only_changes(tmp_path):
+    state = DeltaState(str(tmp_path / 'status.state'))
+    state.update(record())
+    assert state.update(record(uptime='2 days')) == {'tenant': 'tenant', 'filer': 'filer', 'snapshot': 'delta',
+                                                     'uptime': '2 days'}
+    assert state.update(record(uptime='2 days')) == {'tenant': 'tenant', 'filer': 'filer', 'snapshot': 'delta'}
+    state.close()
+
+
+def test_full_snapshot_every_full_every_sweeps(tmp_path):
+    state = DeltaState(str(tmp_path / 'status.state'), full_every=2)
+    snapshots = [state.update(record())['snapshot'] for _ in range(4)]
+    assert snapshots == ['full', 'delta', 'full', 'delta']
+    state.close()
+
+
+def test_config_is_reused_until_config_every_sweeps(tmp_path):
+    state = DeltaState(str(tmp_path / 'status.state'), config_every=3)
+    assert state.reusable_config('tenant', 'filer') is None
+    state.update(record())
+    reused = []
+    for _ in range(4):
+        previous = state.reusable_config('tenant', 'filer')
+        reused.append(previous is not None)
+        state.update(previous or record(), config_reused=previous is not None)
+    assert reused == [True, True, False, True]
+    assert state.reusable_config('tenant', 'other') is None
+    state.close()
@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+from cterasdk import CTERAException
+
+from filer import select_filers
+from fleet import Selector, make_selector
+
+DEVICES = {
+    'tenant-1': [('edge-1', '7.5', True), ('edge-2', '7.6', True), ('core-1', '7.6', False)],
+    'tenant-2': [('edge-1', '7.6', True), ('edge-3', '7.5', True)],
+    'other': [('edge-4', '7.6', True)],
+}
+
+
+def device(tenant, name, version, connected):
+    return SimpleNamespace(name=name, version=version, tenant=tenant,
+                           deviceConnectionStatus=SimpleNamespace(connected=connected),
+                           session=lambda: SimpleNamespace(user=SimpleNamespace(tenant=tenant)))
+
+
+class FakePortal:
+    """Global admin session browsing DEVICES, starting in tenant-1."""
+
+    def __init__(self):
+        self.tenant = 'tenant-1'
+        self.users = SimpleNamespace(session=lambda: SimpleNamespace(user=SimpleNamespace(tenant=self.tenant)))
+        self.devices = SimpleNamespace(filers=self._filers, device=self._device)
+        self.portals = SimpleNamespace(browse=self._browse, browse_global_admin=lambda: None,
+                                       tenants=lambda: [SimpleNamespace(name=name) for name in DEVICES])
+
+    def _browse(self, tenant):
+        if tenant not in DEVICES:
+            raise CTERAException('Not found')
+        self.tenant = tenant
+
+    def _filers(self, include=None):  # pylint: disable=unused-argument
+        return [device(self.tenant, *fields) for fields in DEVICES[self.tenant]]
+
+    def _device(self, name, tenant=None, include=None):  # pylint: disable=unused-argument
+        tenant = tenant or self.tenant
+        for fields in DEVICES.get(tenant, []):
+            if fields[0] == name:
+                return device(tenant, *fields)
+        raise CTERAException('Not found')
+
+
+def selected(all_tenants=False, **selection):
+    filers = select_filers(FakePortal(), make_selector(**selection) or Selector(), all_tenants)
+    return sorted((filer.tenant, filer.name) for filer in filers)
+
+
+def test_current_tenant_by_default():
+    assert selected() == [('tenant-1', 'edge-1'), ('tenant-1', 'edge-2')]
+
+
+def test_device_globs_and_firmware():
+    expected = [('other', 'edge-4'), ('tenant-1', 'edge-2'), ('tenant-2', 'edge-1')]
+    assert selected(True, devices='edge-*', firmware='7.6*') == expected
+
+
+def test_connection_state():
+    assert selected(state='disconnected') == [('tenant-1', 'core-1')]
+    assert len(selected(state='any')) == 3
+
+
+def test_tenant_globs():
+    assert selected(tenants='tenant-*', devices='edge-1') == [('tenant-1', 'edge-1'), ('tenant-2', 'edge-1')]
+
+
+def test_exact_names_are_looked_up():
+    assert selected(tenants='tenant-2,missing', devices='edge-3,edge-4') == [('tenant-2', 'edge-3')]
+    assert selected(devices='edge-2,edge-3') == [('tenant-1', 'edge-2')]
@@ -0,0 +1,112 @@
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+from fleet import BASELINE_WINDOWS, MIN_WINDOW, AdaptiveLimit, run_concurrently
+
+
+def test_hung_filers_do_not_stall_the_rest():
+    release = threading.Event()
+
+    def work(filer):
+        if filer.startswith('hung'):
+            release.wait(15)
+        return filer
+
+    start = time.monotonic()
+    finished = {}
+    try:
+        for result in run_concurrently(work, ['hung-1', 'hung-2', 'ok-1', 'ok-2', 'ok-3'], workers=2, timeout=1):
+            finished[result.filer] = (result.state, time.monotonic() - start)
+    finally:
+        release.set()
+    assert finished['hung-1'][0] == 'timeout'
+    assert finished['hung-2'][0] == 'timeout'
+    for name in ('ok-1', 'ok-2', 'ok-3'):
+        state, elapsed = finished[name]
+        assert state == 'success'
+        assert elapsed < 5
+
+
+def test_hung_filers_do_not_keep_the_process_alive():
+    script = textwrap.dedent("""
+        import time
+        from fleet import run_concurrently
+
+        def work(filer):
+            if filer == 'hung':
+                time.sleep(30)
+            return filer
+
+        print(sorted(result.state for result in run_concurrently(work, ['hung', 'ok'], workers=2, timeout=1)))
+    """)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    start = time.monotonic()
+    output = subprocess.run([sys.executable, '-c', script], cwd=root, capture_output=True, text=True, timeout=30,
+                            check=True).stdout
+    assert output.strip() == "['success', 'timeout']"
+    assert time.monotonic() - start < 10
+
+
+def finish(limit, count, duration=0.05, error=None, in_flight=0):
+    for _ in range(count):
+        limit.record(duration, error, in_flight)
+
+
+def finish_window(limit, **kwargs):
+    finish(limit, max(limit.limit, MIN_WINDOW), **kwargs)
+
+
+def test_limit_is_adjusted_once_per_window():
+    small = AdaptiveLimit(floor=1, ceiling=16, start=2)
+    finish(small, MIN_WINDOW - 1)
+    assert small.limit == 2
+    finish(small, 1)
+    assert small.limit == 3
+    large = AdaptiveLimit(floor=1, ceiling=16, start=8)
+    finish(large, 7)
+    assert large.limit == 8
+    finish(large, 1)
+    assert large.limit == 9
+
+
+def test_transient_errors_halve_the_limit_down_to_the_floor():
+    limit = AdaptiveLimit(floor=2, ceiling=16, start=16)
+    for expected in (8, 4, 2, 2):
+        finish_window(limit, error=OSError('reset'))
+        assert limit.limit == expected
+
+
+def test_other_errors_do_not_lower_the_limit():
+    limit = AdaptiveLimit(floor=1, ceiling=16, start=4)
+    finish(limit, MIN_WINDOW, error=ValueError('rejected'))
+    assert limit.limit == 5
+
+
+def test_a_slower_portal_becomes_the_new_baseline():
+    limit = AdaptiveLimit(floor=1, ceiling=100, start=5)
+    finish_window(limit, duration=1.0)
+    assert limit.limit == 6
+    for _ in range(BASELINE_WINDOWS - 1):
+        finish_window(limit, duration=3.0)
+        assert limit.baseline == 1.0
+    assert limit.limit == 1
+    finish_window(limit, duration=3.0)
+    assert limit.baseline == 3.0
+    assert limit.limit == 2
+
+
+def test_filers_in_flight_when_the_limit_drops_are_skipped():
+    limit = AdaptiveLimit(floor=1, ceiling=16, start=8)
+    finish(limit, 7, error=OSError('reset'))
+    limit.record(0.05, OSError('reset'), in_flight=3)
+    assert limit.limit == 4
+    # Still transient errors, but started at the old limit
+    finish(limit, 3, error=OSError('reset'))
+    finish(limit, MIN_WINDOW - 1)
+    assert limit.limit == 4
+    finish(limit, 1)
+    assert limit.limit == 5
@@ -0,0 +1,36 @@
+import csv
+import json
+
+from merge import merge_outputs
+
+
+def write_csv(path, rows):
+    with open(path, 'w', encoding='utf-8-sig', newline='') as csv_file:
+        csv.writer(csv_file).writerows([['Tenant', 'Filer', 'Uptime']] + rows)
+    return str(path)
+
+
+def read_csv(path):
+    with open(path, encoding='utf-8-sig', newline='') as csv_file:
+        return list(csv.reader(csv_file))
+
+
+def test_last_row_of_a_filer_wins(tmp_path):
+    old = write_csv(tmp_path / 'old.csv', [['t1', 'b', '1 day'], ['t1', 'a', '1 day']])
+    new = write_csv(tmp_path / 'new.csv', [['t1', 'b', '2 days'], ['t2', 'a', '2 days']])
+    merge_outputs(str(tmp_path / 'merged.csv'), [old, new])
+    assert read_csv(tmp_path / 'merged.csv') == [['Tenant', 'Filer', 'Uptime'], ['t1', 'a', '1 day'],
+                                                 ['t1', 'b', '2 days'], ['t2', 'a', '2 days']]
+
+
+def test_run_cmd_results_are_kept_per_command(tmp_path):
+    first = tmp_path / 'first.jsonl'
+    second = tmp_path / 'second.jsonl'
+    first.write_text(''.join(json.dumps(record) + '\n' for record in [
+        {'tenant': 't1', 'filer': 'a', 'command': 'dbg level', 'output': 'old'},
+        {'tenant': 't1', 'filer': 'a', 'command': 'show status', 'output': 'status'}]))
+    second.write_text(json.dumps({'tenant': 't1', 'filer': 'a', 'command': 'dbg level', 'output': 'new'}) + '\n')
+    merge_outputs(str(tmp_path / 'merged.jsonl'), [str(first), str(second)])
+    merged = [json.loads(line) for line in (tmp_path / 'merged.jsonl').read_text().splitlines()]
+    results = [(record['command'], record['output']) for record in merged]
+    assert results == [('dbg level', 'new'), ('show status', 'status')]
@@ -0,0 +1,17 @@
+from types import SimpleNamespace
+
+from perfstats import percentile, sample_stats
+
+
+def test_percentile_is_nearest_rank():
+    assert percentile(list(range(1, 31)), 95) == 29
+    assert percentile(list(range(1, 101)), 7) == 7
+    assert percentile([5], 95) == 5
+
+
+def test_sample_stats_include_the_max():
+    samples = [SimpleNamespace(cpu=cpu, memUsage=100 - cpu) for cpu in (10, 90, 50)]
+    stats = sample_stats(None, SimpleNamespace(proc=SimpleNamespace(perfMonitor=SimpleNamespace(samples=samples))))
+    assert stats['cpu_max'] == 90
+    assert stats['memory_max'] == 90
+    assert stats['cpu_p50'] == 50
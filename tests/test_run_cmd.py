@@ -0,0 +1,7 @@
+from run_cmd import single_filer_run
+
+
+def test_missing_device_is_skipped(tmp_path):
+    results = tmp_path / 'results.csv'
+    single_filer_run(None, 'dbg level', results_file=str(results))
+    assert not results.exists()
@@ -0,0 +1,26 @@
+import csv
+
+from columns import header, select_columns
+from status import appendable_columns
+
+
+def write_header(path, columns):
+    with open(path, 'w', encoding='utf-8-sig', newline='') as csv_file:
+        csv.writer(csv_file).writerow(header(columns))
+
+
+def test_new_files_get_the_error_column(tmp_path):
+    assert 'error' in appendable_columns(str(tmp_path / 'status.csv'), None, None, select_columns())
+
+
+def test_files_without_the_error_column_keep_their_columns(tmp_path):
+    path = str(tmp_path / 'status.csv')
+    old = [name for name in select_columns() if name != 'error']
+    write_header(path, old)
+    assert appendable_columns(path, None, None, select_columns()) == old
+
+
+def test_other_columns_are_left_for_the_writer_to_refuse(tmp_path):
+    path = str(tmp_path / 'status.csv')
+    write_header(path, ['tenant', 'filer', 'uptime'])
+    assert appendable_columns(path, None, None, select_columns()) == select_columns()
@@ -0,0 +1,24 @@
+from types import SimpleNamespace
+
+from filer import FilerEntry
+from suspend_sync import wait_for_suspension
+
+
+def device(polls_until_off):
+    polls = []
+
+    def get_status():
+        polls.append(None)
+        return SimpleNamespace(id='Off' if len(polls) > polls_until_off else 'Syncing')
+    return SimpleNamespace(sync=SimpleNamespace(get_status=get_status))
+
+
+def test_no_timeout_waits_until_sync_stops():
+    devices = {FilerEntry('acme', f'vgw-{i}', f'vgw-{i}', True): device(polls_until_off=i) for i in range(3)}
+    assert wait_for_suspension(devices, timeout=0, interval=0.01) == {}
+
+
+def test_devices_still_syncing_time_out():
+    entry = FilerEntry('acme', 'vgw-1', 'vgw-1', True)
+    assert wait_for_suspension({entry: device(polls_until_off=100)}, timeout=0.05, interval=0.01) == {
+        entry: ('timeout', 'Sync did not stop within 0.05s')}
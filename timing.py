@@ -0,0 +1,94 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from perfstats import percentile
+
+_tracer = None
+
+
+class Tracer:
+    """
+    Timing spans of Portal and Filer API calls, recorded from any thread.
+    Each span has a call type, an optional Filer name, a start and a duration.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self.spans = []
+
+    def record(self, call, filer, start, duration):
+        with self._lock:
+            self.spans.append((call, filer, start - self._origin, duration, threading.get_ident()))
+
+    def summary(self, top=10):
+        """Return totals and percentiles per call type, and the slowest Filers by total call time."""
+        with self._lock:
+            spans = list(self.spans)
+        calls = defaultdict(list)
+        filers = defaultdict(float)
+        for call, filer, _, duration, _ in spans:
+            calls[call].append(duration)
+            if filer is not None:
+                filers[filer] += duration
+        summary = {}
+        for call, durations in sorted(calls.items()):
+            durations.sort()
+            summary[call] = {'count': len(durations), 'total': sum(durations),
+                             'p50': percentile(durations, 50), 'p95': percentile(durations, 95),
+                             'p99': percentile(durations, 99), 'max': durations[-1]}
+        slowest = sorted(filers.items(), key=lambda item: item[1], reverse=True)[:top]
+        return summary, slowest
+
+    def log_summary(self, top=10):
+        """Log the timing summary."""
+        summary, slowest = self.summary(top)
+        for call, stats in summary.items():
+            logging.info("%s: %s calls, %.3fs total, p50 %.3fs p95 %.3fs p99 %.3fs max %.3fs", call,
+                         stats['count'], stats['total'], stats['p50'], stats['p95'], stats['p99'], stats['max'])
+        for rank, (filer, total) in enumerate(slowest, start=1):
+            logging.info("Slowest Filer #%s: %s %.3fs", rank, filer, total)
+
+    def write_trace(self, filename):
+        """Save spans in the Chrome trace event format, for chrome://tracing or Perfetto."""
+        with self._lock:
+            spans = list(self.spans)
+        events = [{'name': call, 'cat': 'api', 'ph': 'X', 'pid': os.getpid(), 'tid': thread,
+                   'ts': round(start * 1e6), 'dur': round(duration * 1e6), 'args': {'filer': filer}}
+                  for call, filer, start, duration, thread in spans]
+        with open(filename, mode='w', encoding='utf-8') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
+        logging.info("Saved %s timing spans to %s", len(events), filename)
+
+
+def start_tracing():
+    """Start recording spans and return the Tracer."""
+    global _tracer  # pylint: disable=global-statement
+    _tracer = Tracer()
+    return _tracer
+
+
+def stop_tracing():
+    """Stop recording spans and return the Tracer, if any."""
+    global _tracer  # pylint: disable=global-statement
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+@contextmanager
+def span(call, filer=None):
+    """Time the enclosed API call when tracing is on. Failed calls are recorded too."""
+    tracer = _tracer
+    if tracer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        tracer.record(call, filer, start, time.perf_counter() - start)
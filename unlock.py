@@ -1,5 +1,7 @@
 import logging
 from cterasdk import CTERAException
+from bulk import select_devices, run_action
+from fleet import DEFAULT_WORKERS, DEFAULT_TIMEOUT
 
 
 def catch(error=None, device_name=None):
@@ -32,30 +34,26 @@ def enable_telnet(self, device_name, tenant_name, code=None):
             logging.info("Bad code or something went wrong unlocking device.")
 
 
-def start_ssh(self, device_name, tenant_name, pubkey=None):
+def start_ssh(self, device_name, tenant_name, pubkey=None, device_file=None, workers=DEFAULT_WORKERS,
+              timeout=DEFAULT_TIMEOUT, rate=None, results_file=None, inventory=None, selector=None):
     """
-    Start SSH Daemon on given 7.0+ Filer
-    If provided, copy public key to given Filer
+    Start SSH Daemon on given 7.0+ Filers
+    If provided, copy public key to given Filers
     If no public key, create a new keypair using device_name
     Save device_name.pub and device_name.pem to Downloads folder.
     """
     logging.info("Starting task to enable SSH on Filer.")
-    try:
-        filer = self.devices.device(device_name, tenant_name)
-        filer.ssh.enable(public_key=pubkey)
-        logging.info("Finished task to enable SSH on Filer.")
-    except (CTERAException) as error:
-        catch(error, device_name)
-        logging.info("Failed task to enable SSH on Filer.")
+    devices = select_devices(self, device_name, tenant_name, device_file, inventory, selector)
+    run_action(self, 'enable SSH', lambda filer: filer.ssh.enable(public_key=pubkey), devices,
+               workers, timeout, rate, results_file)
+    logging.info("Finished task to enable SSH on Filer.")
 
 
-def disable_ssh(self, device_name, tenant_name):
-    """Stop SSH Daemon on a given Filer"""
+def disable_ssh(self, device_name, tenant_name, device_file=None, workers=DEFAULT_WORKERS,
+                timeout=DEFAULT_TIMEOUT, rate=None, results_file=None, inventory=None, selector=None):
+    """Stop SSH Daemon on given Filers"""
     logging.info("Starting task to disable SSH on Filer: %s on Tenant: %s", device_name, tenant_name)
-    try:
-        filer = self.devices.device(device_name, tenant_name)
-        filer.ssh.disable()
-        logging.info("Finished task to disable SSH on Filer: %s on Tenant: %s.", device_name, tenant_name)
-    except (CTERAException) as error:
-        catch(error, device_name)
-        logging.info("Failed task to disable SSH on Filer.")
+    devices = select_devices(self, device_name, tenant_name, device_file, inventory, selector)
+    run_action(self, 'disable SSH', lambda filer: filer.ssh.disable(), devices,
+               workers, timeout, rate, results_file)
+    logging.info("Finished task to disable SSH on Filer: %s on Tenant: %s.", device_name, tenant_name)
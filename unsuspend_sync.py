@@ -1,14 +1,13 @@
 import logging
-from cterasdk import CTERAException
+from bulk import select_devices, run_action
+from fleet import DEFAULT_WORKERS, DEFAULT_TIMEOUT
 
 
-def unsuspend_filer_sync(self=None, device_name=None, tenant_name=None):
-    """Unsuspend sync on a device"""
+def unsuspend_filer_sync(self=None, device_name=None, tenant_name=None, device_file=None, workers=DEFAULT_WORKERS,
+                         timeout=DEFAULT_TIMEOUT, rate=None, results_file=None, inventory=None, selector=None):
+    """Unsuspend sync on devices"""
     logging.info("Starting unsuspend sync task.")
-    device = self.devices.device(device_name, tenant_name)
-    try:
-        device.sync.unsuspend()
-        logging.info("Unsuspended sync on %s", device.name)
-    except CTERAException as e:
-        logging.warning(e)
-        logging.info("Error unsuspending sync on %s", device.name)
+    devices = select_devices(self, device_name, tenant_name, device_file, inventory, selector)
+    run_action(self, 'unsuspend sync', lambda device: device.sync.unsuspend(), devices,
+               workers, timeout, rate, results_file)
+    logging.info("Finished unsuspend sync task.")
@@ -0,0 +1,163 @@
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from filer import iter_filers
+from fleet import DEFAULT_WORKERS, DEFAULT_TIMEOUT
+from status import open_status_output, write_status
+
+DEFAULT_INTERVAL = 300
+DEFAULT_PORT = 9810
+DEFAULT_BIND = '127.0.0.1'
+
+# Columns polled by watch. Only the cloudsync, perfMonitor and storage summary paths are requested.
+WATCH_COLUMNS = ['tenant', 'filer', 'sync_status', 'uploading_files', 'scanning_files', 'performance', 'volume',
+                 'error']
+
+# Gauges exposed per Filer: (metric name, record field, help text)
+GAUGES = [('ctools_filer_uploading_files', 'uploading_files', 'Files waiting to upload'),
+          ('ctools_filer_scanning_files', 'scanning_files', 'Files being scanned'),
+          ('ctools_filer_cpu_percent', 'cpu', 'Current CPU usage'),
+          ('ctools_filer_memory_percent', 'memory', 'Current memory usage'),
+          ('ctools_filer_volume_total', 'volume_total', 'Total volume space'),
+          ('ctools_filer_volume_used', 'volume_used', 'Used volume space'),
+          ('ctools_filer_volume_free', 'volume_free', 'Free volume space'),
+          ]
+
+
+def escape(value):
+    """Escape a Prometheus label value."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """
+    Latest status of each Filer, rendered in the Prometheus text format.
+    Updated by the polling loop and read by the HTTP server thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filers = {}
+        self.sweeps = 0
+
+    def update(self, record, duration):
+        """Store the latest status record of a Filer."""
+        with self._lock:
+            self._filers[(record['tenant'], record['filer'])] = {
+                'up': 1, 'record': record, 'duration': duration, 'polled': time.time()}
+
+    def down(self, tenant, filer, duration):
+        """Mark a Filer as unreachable, keeping its last known values."""
+        with self._lock:
+            entry = self._filers.setdefault((tenant, filer), {'record': {}})
+            entry.update(up=0, duration=duration, polled=time.time())
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            filers = sorted(self._filers.items())
+            sweeps = self.sweeps
+        lines = ['# HELP ctools_sweeps_total Completed watch sweeps', '# TYPE ctools_sweeps_total counter',
+                 f'ctools_sweeps_total {sweeps}']
+
+        def gauge(name, help_text, values):
+            lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} gauge'])
+            for (tenant, filer), labels, value in values:
+                extra = ''.join(f',{key}="{escape(label)}"' for key, label in labels.items())
+                lines.append(f'{name}{{tenant="{escape(tenant)}",filer="{escape(filer)}"{extra}}} {value}')
+
+        gauge('ctools_filer_up', 'Whether the last poll of the Filer succeeded',
+              [(key, {}, entry['up']) for key, entry in filers])
+        gauge('ctools_filer_last_poll_timestamp_seconds', 'Time of the last poll of the Filer',
+              [(key, {}, round(entry['polled'], 3)) for key, entry in filers])
+        gauge('ctools_filer_poll_duration_seconds', 'Duration of the last poll of the Filer',
+              [(key, {}, round(entry['duration'], 3)) for key, entry in filers])
+        gauge('ctools_filer_sync_status', 'CloudSync service status of the Filer',
+              [(key, {'status': entry['record']['sync_status']}, 1) for key, entry in filers
+               if entry['record'].get('sync_status') is not None])
+        for name, field, help_text in GAUGES:
+            values = []
+            for key, entry in filers:
+                try:
+                    values.append((key, {}, float(entry['record'][field])))
+                except (KeyError, TypeError, ValueError):
+                    continue
+            gauge(name, help_text, values)
+        return '\n'.join(lines) + '\n'
+
+
+def start_metrics_server(metrics, port=DEFAULT_PORT, bind=DEFAULT_BIND):
+    """Serve metrics at /metrics from a background thread and return the server."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):  # pylint: disable=invalid-name
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            logging.debug("Metrics request: " + format, *args)
+
+    server = ThreadingHTTPServer((bind, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logging.info("Serving metrics at http://%s:%s/metrics", bind, server.server_port)
+    return server
+
+
+def watch(self, all_tenants, interval=DEFAULT_INTERVAL, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT,
+          inventory=None, port=DEFAULT_PORT, bind=DEFAULT_BIND, filename=None, sweeps=None, selector=None):
+    """
+    Poll Filers on a schedule and serve their latest metrics over HTTP.
+
+    The Portal session is kept open between sweeps, and with an inventory
+    the Filer list is only browsed again when its cache expires. Each
+    sweep starts its polls evenly over the interval instead of in a burst.
+
+    :param bool all_tenants: Poll all Filers on all Tenants
+    :param int,optional interval: Seconds between sweeps
+    :param int,optional workers: Number of Filers to poll at once, or an AdaptiveLimit
+    :param int,optional timeout: Seconds allowed per Filer
+    :param Inventory,optional inventory: Cached Filer inventory
+    :param int,optional port: Metrics port. 0 picks a free port
+    :param str,optional bind: Metrics address. Default localhost only
+    :param str,optional filename: Also record each sweep to this status output, e.g. a .db history
+    :param int,optional sweeps: Stop after this many sweeps. Default run until interrupted
+    :param Selector,optional selector: Only poll the Filers it matches
+    """
+    logging.info('Starting watch task')
+    metrics = Metrics()
+    server = start_metrics_server(metrics, port, bind)
+    try:
+        while sweeps is None or metrics.sweeps < sweeps:
+            started = time.monotonic()
+            try:
+                filers = list(iter_filers(self, all_tenants, inventory, selector=selector, compact=True))
+                logging.info("Polling %s Filers over %ss", len(filers), interval)
+                writer = open_status_output(filename, columns=WATCH_COLUMNS) if filename else None
+                try:
+                    write_status(self, writer, all_tenants, workers, timeout, columns=WATCH_COLUMNS,
+                                 filers=filers, metrics=metrics, spacing=interval / max(1, len(filers)))
+                finally:
+                    if writer:
+                        writer.close()
+            except Exception as error:  # pylint: disable=broad-except
+                # Keep watching. The next sweep may succeed, e.g. once the Portal is reachable again.
+                logging.error("Watch sweep failed: %s", error)
+            metrics.sweeps += 1
+            remaining = interval - (time.monotonic() - started)
+            if remaining > 0 and (sweeps is None or metrics.sweeps < sweeps):
+                time.sleep(remaining)
+    except KeyboardInterrupt:
+        logging.info('Watch interrupted')
+    finally:
+        server.shutdown()
+        server.server_close()
+    logging.info('Finished watch task.')